@@ -0,0 +1,13 @@
+# Gunicorn configuration for running the FastAPI app with uvicorn workers
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# One async worker per usable CPU (affinity-aware), capped because each worker keeps
+# its own Gemini/template/credential caches and template refresh loop.
+# Set WEB_CONCURRENCY to match container CPU quotas, which affinity does not reflect.
+_usable_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+workers = int(os.getenv("WEB_CONCURRENCY", min(_usable_cpus, 4)))
+keepalive = 30
+# Per-request logging already happens in the endpoints
+accesslog = None
@@ -4,8 +4,10 @@ Provides operations for sending messages, managing channels, etc.
 """
 
 from typing import Dict, List, Any, Optional
+from urllib.parse import quote
 import httpx
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,36 @@ class DiscordHelpers:
     
     BASE_URL = "https://discord.com/api/v10"
     
+    # Shared across calls so requests reuse pooled keep-alive connections to Discord
+    _client: Optional[httpx.AsyncClient] = None
+    
+    @staticmethod
+    def _get_client() -> httpx.AsyncClient:
+        """Return the shared Discord HTTP client, creating it on first use."""
+        if DiscordHelpers._client is None or DiscordHelpers._client.is_closed:
+            DiscordHelpers._client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0)
+            )
+        return DiscordHelpers._client
+    
+    @staticmethod
+    def _auth_headers(access_token: str) -> Dict[str, str]:
+        """Per-request auth headers (tokens are not retained beyond the call)."""
+        return {"Authorization": "Bot " + access_token}
+    
+    @staticmethod
+    def _json_headers(access_token: str) -> Dict[str, str]:
+        """Auth headers plus Content-Type for orjson-encoded request bodies."""
+        return {"Authorization": "Bot " + access_token, "Content-Type": "application/json"}
+    
+    @staticmethod
+    async def aclose() -> None:
+        """Close the shared Discord HTTP client (called on app shutdown)."""
+        if DiscordHelpers._client is not None:
+            await DiscordHelpers._client.aclose()
+            DiscordHelpers._client = None
+    
     @staticmethod
     async def send_message(
         access_token: str,
@@ -35,27 +67,21 @@ class DiscordHelpers:
             Dict with sent message data
         """
         try:
-            headers = {
-                "Authorization": f"Bot {access_token}",
-                "Content-Type": "application/json"
-            }
-            
             payload = {"content": content}
             if embeds:
                 payload["embeds"] = embeds
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{DiscordHelpers.BASE_URL}/channels/{channel_id}/messages",
-                    headers=headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                
-                return {
-                    "success": True,
-                    "message": response.json()
-                }
+            response = await DiscordHelpers._get_client().post(
+                f"{DiscordHelpers.BASE_URL}/channels/{quote(str(channel_id), safe='')}/messages",
+                headers=DiscordHelpers._json_headers(access_token),
+                content=orjson.dumps(payload)
+            )
+            response.raise_for_status()
+            
+            return {
+                "success": True,
+                "message": orjson.loads(response.content)
+            }
                 
         except httpx.HTTPError as error:
             logger.error(f"Discord API error sending message: {error}")
@@ -80,21 +106,16 @@ class DiscordHelpers:
             Dict with channel data
         """
         try:
-            headers = {
-                "Authorization": f"Bot {access_token}"
-            }
+            response = await DiscordHelpers._get_client().get(
+                f"{DiscordHelpers.BASE_URL}/channels/{quote(str(channel_id), safe='')}",
+                headers=DiscordHelpers._auth_headers(access_token)
+            )
+            response.raise_for_status()
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{DiscordHelpers.BASE_URL}/channels/{channel_id}",
-                    headers=headers
-                )
-                response.raise_for_status()
-                
-                return {
-                    "success": True,
-                    "channel": response.json()
-                }
+            return {
+                "success": True,
+                "channel": orjson.loads(response.content)
+            }
                 
         except httpx.HTTPError as error:
             logger.error(f"Discord API error getting channel: {error}")
@@ -3,6 +3,10 @@ Central registry of all available helper functions.
 Used by Gemini to understand what operations are available.
 """
 
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Iterable, Mapping
+
 from .gmail_helpers import GMAIL_FUNCTIONS
 from .gcalendar_helpers import GCALENDAR_FUNCTIONS
 from .notion_helpers import NOTION_FUNCTIONS
@@ -34,3 +38,23 @@ def get_functions_for_apps(app_names: list[str]) -> dict:
         app: FUNCTION_REGISTRY.get(app.lower(), {})
         for app in app_names
     }
+
+
+def get_functions_for_app_set(app_names: Iterable[str]) -> Mapping[str, dict]:
+    """
+    Cached variant of get_functions_for_apps for a set of connected apps.
+    Apps are de-duplicated and sorted, so the same set always maps to the same
+    (read-only) result regardless of the order Supabase returned them in.
+    
+    Args:
+        app_names: App names the user has connected
+        
+    Returns:
+        Read-only mapping of app names to their available functions
+    """
+    return _functions_for_sorted_apps(tuple(sorted(set(app_names))))
+
+
+@lru_cache(maxsize=256)
+def _functions_for_sorted_apps(app_names: tuple) -> Mapping[str, dict]:
+    return MappingProxyType(get_functions_for_apps(list(app_names)))
@@ -8,6 +8,7 @@ from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from datetime import datetime, timedelta
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -62,7 +63,7 @@ class GCalendarHelpers:
             if query:
                 params['q'] = query
             
-            events_result = service.events().list(**params).execute()
+            events_result = await asyncio.to_thread(service.events().list(**params).execute)
             events = events_result.get('items', [])
             
             return {
@@ -129,10 +130,10 @@ class GCalendarHelpers:
             if attendees:
                 event['attendees'] = [{'email': email} for email in attendees]
             
-            created_event = service.events().insert(
+            created_event = await asyncio.to_thread(service.events().insert(
                 calendarId=calendar_id,
                 body=event
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -166,10 +167,10 @@ class GCalendarHelpers:
         try:
             service = GCalendarHelpers._get_service(access_token)
             
-            event = service.events().get(
+            event = await asyncio.to_thread(service.events().get(
                 calendarId=calendar_id,
                 eventId=event_id
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -218,10 +219,10 @@ class GCalendarHelpers:
             service = GCalendarHelpers._get_service(access_token)
             
             # Get existing event
-            event = service.events().get(
+            event = await asyncio.to_thread(service.events().get(
                 calendarId=calendar_id,
                 eventId=event_id
-            ).execute()
+            ).execute)
             
             # Update fields
             if summary:
@@ -237,11 +238,11 @@ class GCalendarHelpers:
             if attendees:
                 event['attendees'] = [{'email': email} for email in attendees]
             
-            updated_event = service.events().update(
+            updated_event = await asyncio.to_thread(service.events().update(
                 calendarId=calendar_id,
                 eventId=event_id,
                 body=event
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -275,10 +276,10 @@ class GCalendarHelpers:
         try:
             service = GCalendarHelpers._get_service(access_token)
             
-            service.events().delete(
+            await asyncio.to_thread(service.events().delete(
                 calendarId=calendar_id,
                 eventId=event_id
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -9,11 +9,51 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import base64
 from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Partial-response mask for messages.list: only the fields list_messages returns
+_LIST_MESSAGES_FIELDS = "messages(id,threadId),resultSizeEstimate"
+
+
+# RFC 5322 recommended header line length; longer lines are left to MIMEText to fold
+_MAX_HEADER_LINE = 78
+
+
+def _build_raw_message(to: str, subject: str, body: str, subtype: str = "plain", **extra_headers: Optional[str]) -> str:
+    """
+    Build a base64url-encoded RFC 822 message for the Gmail API.
+    
+    Plain ASCII messages whose header lines fit in 78 characters are assembled
+    directly; anything needing charset/header encoding or RFC 5322 header
+    folding falls back to MIMEText.
+    """
+    headers = {"To": to, "Subject": subject}
+    headers.update((name.capitalize(), value) for name, value in extra_headers.items() if value)
+    
+    for name, value in headers.items():
+        if "\r" in value or "\n" in value:
+            raise ValueError(f"Invalid {name} header: line breaks are not allowed")
+    
+    if body.isascii() and all(
+        value.isascii() and len(name) + 2 + len(value) <= _MAX_HEADER_LINE for name, value in headers.items()
+    ):
+        head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        raw_bytes = (
+            f"{head}MIME-Version: 1.0\r\n"
+            f"Content-Type: text/{subtype}; charset=\"us-ascii\"\r\n"
+            f"Content-Transfer-Encoding: 7bit\r\n\r\n"
+        ).encode("ascii") + body.encode("ascii")
+    else:
+        message = MIMEText(body, subtype, "utf-8")
+        for name, value in headers.items():
+            message[name] = value
+        raw_bytes = message.as_bytes()
+    
+    return base64.urlsafe_b64encode(raw_bytes).decode("ascii")
+
 
 class GmailHelpers:
     """Helper class for Gmail operations."""
@@ -48,7 +88,8 @@ class GmailHelpers:
             
             params = {
                 'userId': 'me',
-                'maxResults': max_results
+                'maxResults': max_results,
+                'fields': _LIST_MESSAGES_FIELDS
             }
             
             if query:
@@ -56,7 +97,7 @@ class GmailHelpers:
             if label_ids:
                 params['labelIds'] = label_ids
             
-            results = service.users().messages().list(**params).execute()
+            results = await asyncio.to_thread(service.users().messages().list(**params).execute)
             messages = results.get('messages', [])
             
             return {
@@ -76,7 +117,8 @@ class GmailHelpers:
     async def get_message(
         access_token: str,
         message_id: str,
-        format: str = "full"
+        format: str = "full",
+        metadata_headers: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         Get a specific Gmail message.
@@ -85,6 +127,7 @@ class GmailHelpers:
             access_token: User's Gmail access token
             message_id: ID of the message to retrieve
             format: Format of the message (full, metadata, minimal, raw)
+            metadata_headers: Headers to include when format is "metadata" (e.g. ["From", "Subject"])
             
         Returns:
             Dict with message data
@@ -92,11 +135,11 @@ class GmailHelpers:
         try:
             service = GmailHelpers._get_service(access_token)
             
-            message = service.users().messages().get(
-                userId='me',
-                id=message_id,
-                format=format
-            ).execute()
+            params = {'userId': 'me', 'id': message_id, 'format': format}
+            if format == "metadata" and metadata_headers:
+                params['metadataHeaders'] = metadata_headers
+            
+            message = await asyncio.to_thread(service.users().messages().get(**params).execute)
 
             
             return {
@@ -111,6 +154,83 @@ class GmailHelpers:
                 "error": str(error)
             }
     
+    @staticmethod
+    async def get_messages(
+        access_token: str,
+        message_ids: List[str],
+        format: str = "full",
+        metadata_headers: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Get several Gmail messages in one batched HTTP request.
+        
+        Args:
+            access_token: User's Gmail access token
+            message_ids: IDs of the messages to retrieve (up to 100)
+            format: Format of the messages (full, metadata, minimal, raw)
+            metadata_headers: Headers to include when format is "metadata" (e.g. ["From", "Subject"])
+            
+        Returns:
+            Dict with messages in the same order as message_ids, plus per-ID errors
+        """
+        try:
+            # A lone ID would otherwise be iterated character by character
+            if isinstance(message_ids, str):
+                message_ids = [message_ids]
+            elif not isinstance(message_ids, (list, tuple)):
+                return {
+                    "success": False,
+                    "error": "message_ids must be a list of message IDs"
+                }
+            
+            service = GmailHelpers._get_service(access_token)
+            message_ids = list(message_ids)[:100]
+            
+            messages: Dict[str, Any] = {}
+            errors: Dict[str, str] = {}
+            
+            def on_response(request_id, response, exception):
+                if exception is not None:
+                    errors[request_id] = str(exception)
+                else:
+                    messages[request_id] = response
+            
+            params = {'userId': 'me', 'format': format}
+            if format == "metadata" and metadata_headers:
+                params['metadataHeaders'] = metadata_headers
+            
+            batch = service.new_batch_http_request(callback=on_response)
+            for message_id in message_ids:
+                batch.add(
+                    service.users().messages().get(id=message_id, **params),
+                    request_id=message_id
+                )
+            if message_ids:
+                await asyncio.to_thread(batch.execute)
+            
+            if errors:
+                logger.error(f"Gmail API errors getting {len(errors)} of {len(message_ids)} messages")
+                if not messages:
+                    return {
+                        "success": False,
+                        "error": next(iter(errors.values())),
+                        "errors": errors
+                    }
+            
+            # Partial failures still succeed; failed IDs are reported in "errors"
+            return {
+                "success": True,
+                "messages": [messages[message_id] for message_id in message_ids if message_id in messages],
+                "errors": errors
+            }
+            
+        except HttpError as error:
+            logger.error(f"Gmail API error getting messages: {error}")
+            return {
+                "success": False,
+                "error": str(error)
+            }
+    
     @staticmethod
     async def send_message(
         access_token: str,
@@ -139,24 +259,12 @@ class GmailHelpers:
         try:
             service = GmailHelpers._get_service(access_token)
             
-            message = MIMEMultipart() if html else MIMEText(body)
-            message['to'] = to
-            message['subject'] = subject
-            
-            if cc:
-                message['cc'] = cc
-            if bcc:
-                message['bcc'] = bcc
-            
-            if html:
-                message.attach(MIMEText(body, 'html'))
+            raw_message = _build_raw_message(to, subject, body, 'html' if html else 'plain', cc=cc, bcc=bcc)
             
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            
-            sent_message = service.users().messages().send(
+            sent_message = await asyncio.to_thread(service.users().messages().send(
                 userId='me',
                 body={'raw': raw_message}
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -188,10 +296,10 @@ class GmailHelpers:
         try:
             service = GmailHelpers._get_service(access_token)
             
-            service.users().messages().delete(
+            await asyncio.to_thread(service.users().messages().delete(
                 userId='me',
                 id=message_id
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -233,11 +341,11 @@ class GmailHelpers:
             if remove_label_ids:
                 body['removeLabelIds'] = remove_label_ids
             
-            modified_message = service.users().messages().modify(
+            modified_message = await asyncio.to_thread(service.users().messages().modify(
                 userId='me',
                 id=message_id,
                 body=body
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -275,16 +383,12 @@ class GmailHelpers:
         try:
             service = GmailHelpers._get_service(access_token)
             
-            message = MIMEText(body, 'html' if html else 'plain')
-            message['to'] = to
-            message['subject'] = subject
-            
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+            raw_message = _build_raw_message(to, subject, body, 'html' if html else 'plain')
             
-            draft = service.users().drafts().create(
+            draft = await asyncio.to_thread(service.users().drafts().create(
                 userId='me',
                 body={'message': {'raw': raw_message}}
-            ).execute()
+            ).execute)
             
             return {
                 "success": True,
@@ -315,7 +419,17 @@ GMAIL_FUNCTIONS = {
         "description": "Get a specific Gmail message by ID",
         "parameters": {
             "message_id": "ID of the message to retrieve",
-            "format": "Format of the message (full, metadata, minimal, raw)"
+            "format": "Format of the message (full, metadata, minimal, raw); use metadata when only headers are needed",
+            "metadata_headers": "Headers to return with format 'metadata', e.g. ['From', 'Subject', 'Date'] (optional)"
+        }
+    },
+    "get_messages": {
+        "name": "get_messages",
+        "description": "Get several Gmail messages by ID in a single batched request (prefer over repeated get_message)",
+        "parameters": {
+            "message_ids": "List of message IDs to retrieve (up to 100)",
+            "format": "Format of the messages (full, metadata, minimal, raw); use metadata when only headers are needed",
+            "metadata_headers": "Headers to return with format 'metadata', e.g. ['From', 'Subject', 'Date'] (optional)"
         }
     },
     "send_message": {
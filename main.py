@@ -1,45 +1,137 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, Header, HTTPException, Request, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import os
+import re
+import asyncio
+import hashlib
+import hmac
 import logging
+import time
+from contextlib import asynccontextmanager
+import httpx
+import orjson
 from dotenv import load_dotenv
 
-from services.gemini_service import GeminiService
+from services.gemini_service import GeminiService, FunctionCall
 from services.supabase_service import SupabaseService
 from services.proxy_service import ProxyService
-from helpers.function_registry import get_functions_for_apps
+from services.n8n_service import N8nService
+from helpers.function_registry import get_functions_for_app_set
+from middleware import FastCORS
 
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
+# HTTP status codes used by the endpoints, bound once at module level
+HTTP_400 = status.HTTP_400_BAD_REQUEST
+HTTP_422 = status.HTTP_422_UNPROCESSABLE_ENTITY
+HTTP_500 = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+# Shared secret for operator-only endpoints; they are disabled when unset
+CACHE_ADMIN_TOKEN = os.getenv("CACHE_ADMIN_TOKEN", "")
+
+# Shared keep-alive HTTP client for outbound calls (n8n, OAuth token refresh).
+# HTTP/2 is negotiated via ALPN on TLS hosts (oauth2.googleapis.com); plain-http n8n stays on HTTP/1.1.
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=50, max_connections=200, keepalive_expiry=30),
+    timeout=httpx.Timeout(10.0)
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresher = asyncio.create_task(_template_cache.refresh_forever())
+    yield
+    refresher.cancel()
+    await n8n_service.aclose()
+    await proxy_service.aclose()
+    await http_client.aclose()
+
+
 app = FastAPI(
     title="Blimp MCP Server",
     description="AI-powered automation platform MCP server",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
-# CORS middleware
+# CORS middleware; origins come from CORS_ORIGINS (comma-separated, default "*").
+# Credentials are only allowed with an explicit origin list so the wildcard
+# case can answer with a static "*" instead of echoing the Origin header.
+cors_origins = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()]
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Configure this based on your frontend domain
-    allow_credentials=True,
-    allow_methods=["*"],
+    FastCORS,
+    allow_origins=cors_origins,
+    allow_credentials="*" not in cors_origins,
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
 
-# Security
-security = HTTPBearer()
+# Compress larger JSON bodies (proxied Gmail/Drive/Notion results); small replies are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 # Initialize services
 gemini_service = GeminiService()
 supabase_service = SupabaseService()
-proxy_service = ProxyService()
+proxy_service = ProxyService(http_client)
+n8n_service = N8nService(http_client)
+
+
+class _TemplateCache:
+    """
+    In-memory copy of the active workflow templates plus a digest of their content.
+    Requests are served from memory; a background task refreshes it every TTL and
+    concurrent misses coalesce into a single Supabase read.
+    """
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.value: Optional[Tuple[List[Dict[str, Any]], str]] = None
+        self.expires_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def get(self) -> Tuple[List[Dict[str, Any]], str]:
+        if self.value is not None and (time.monotonic() < self.expires_at or self._lock.locked()):
+            # Fresh, or stale while another request is already refreshing
+            return self.value
+        async with self._lock:
+            if self.value is None or time.monotonic() >= self.expires_at:
+                await self._load()
+            return self.value
+    
+    async def _load(self) -> None:
+        templates = await supabase_service.get_all_workflow_templates()
+        version = hashlib.blake2b(orjson.dumps(templates, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+        self.value = (templates, version)
+        # Empty results may mean a failed read, so don't pin them for a whole TTL
+        self.expires_at = time.monotonic() + self.ttl if templates else 0.0
+    
+    async def refresh_forever(self) -> None:
+        while True:
+            try:
+                async with self._lock:
+                    await self._load()
+            except Exception:
+                logger.exception("Background template refresh failed")
+            await asyncio.sleep(self.ttl)
+    
+    def clear(self) -> int:
+        cleared = int(self.value is not None)
+        self.value = None
+        self.expires_at = 0.0
+        return cleared
+
+
+# Workflow templates change rarely; keep them in memory for SUPABASE_CACHE_TTL seconds
+_template_cache = _TemplateCache(ttl=float(os.getenv("SUPABASE_CACHE_TTL", "30")))
 
 # Request/Response Models
 class PromptRequest(BaseModel):
@@ -115,45 +207,73 @@ class ProxyResponse(BaseModel):
     data: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
-# Authentication dependency
-async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Verify bearer token from request header"""
-    token = credentials.credentials
-    # Add your token verification logic here
-    # For now, we'll just check if token exists
-    if not token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return token
+
+# Finish schema/validator construction at import rather than on the first request
+for _model in (
+    PromptRequest, AppStatus, PromptResponse, ExecuteWorkflowRequest, ExecuteWorkflowResponse,
+    AppCredentials, AppMetadata, ConnectAppRequest, ConnectAppResponse, ProxyRequest, ProxyResponse
+):
+    _model.model_rebuild()
+
+
+def _model_response(model: BaseModel) -> ORJSONResponse:
+    """
+    Serialize an already-validated response model directly.
+    Returning a Response bypasses FastAPI's response_model re-validation;
+    the response_model on each route is kept for the OpenAPI schema only.
+    """
+    return ORJSONResponse(content=model.model_dump())
+
+async def get_cached_workflow_templates() -> Tuple[List[Dict[str, Any]], str]:
+    """Return active workflow templates and a digest of their content from memory"""
+    return await _template_cache.get()
+
+
+# Static probe payloads, serialized once at import
+_ROOT_BODY = orjson.dumps({
+    "status": "healthy",
+    "service": "Blimp MCP Server",
+    "version": "1.0.0"
+})
+_HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "services": {
+        "gemini": "operational",
+        "supabase": "operational"
+    }
+})
 
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "Blimp MCP Server",
-        "version": "1.0.0"
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
-    return {
-        "status": "healthy",
-        "services": {
-            "gemini": "operational",
-            "supabase": "operational"
-        }
-    }
+    return Response(content=_HEALTH_BODY, media_type="application/json")
+
+
+@app.post("/cache/invalidate", include_in_schema=False)
+async def invalidate_cache(x_admin_token: Optional[str] = Header(None)):
+    """
+    Drop cached Supabase reads and Gemini analyses, e.g. after workflow templates change.
+    Requires the X-Admin-Token header to match CACHE_ADMIN_TOKEN.
+    """
+    if not CACHE_ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), CACHE_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+    
+    cleared = _template_cache.clear() + gemini_service.clear_cache()
+    logger.info("Invalidated %d cached entries", cleared)
+    return {"status": "success", "cleared": cleared}
 
 
 @app.post("/prompt", response_model=PromptResponse)
-async def process_prompt(request: PromptRequest):
+async def process_prompt(request: PromptRequest, no_cache: bool = False):
     """
     Process user prompt through Gemini, check connected apps, and prepare workflow
     
@@ -163,68 +283,78 @@ async def process_prompt(request: PromptRequest):
     3. Extract required apps from Gemini response
     4. Check Supabase for user's connected apps
     5. Return status with app connection information
+    
+    Identical prompts against the same template set reuse the previous Gemini
+    analysis for GEMINI_CACHE_TTL seconds; pass ?no_cache=true to bypass it.
     """
     try:
-        logger.info(f"Processing prompt for user: {request.user_id}")
+        logger.info("Processing prompt for user: %s", request.user_id)
         
-        # Step 1: Send prompt to Gemini for analysis
-        logger.info("Sending prompt to Gemini 2.5 Flash")
-        templates = await supabase_service.get_all_workflow_templates()
-        gemini_response = await gemini_service.analyze_prompt(request.prompt, templates)
-        
-        if not gemini_response:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to get response from Gemini"
+        # Step 1: Start the connected-apps lookup now so its Supabase round trip
+        # overlaps the template load and the Gemini call; it's only needed in step 4
+        connected_task = asyncio.create_task(supabase_service.get_user_connected_apps(request.user_id))
+        try:
+            templates, templates_version = await get_cached_workflow_templates()
+            
+            # Step 2: Send prompt to Gemini for analysis
+            logger.info("Sending prompt to Gemini 2.5 Flash")
+            gemini_response = await gemini_service.analyze_prompt(
+                request.prompt,
+                templates,
+                templates_version=templates_version,
+                use_cache=not no_cache
             )
+            
+            if not gemini_response:
+                raise HTTPException(
+                    status_code=HTTP_500,
+                    detail="Failed to get response from Gemini"
+                )
+            
+            connected_apps = await connected_task
+        finally:
+            # No-op once awaited; otherwise don't leave the lookup running
+            connected_task.cancel()
         
-        # Step 2: Extract required apps from Gemini response
+        # Step 3: Extract required apps from Gemini response
         required_apps = gemini_response.get("required_apps", [])
-        logger.info(f"Required apps identified: {required_apps}")
+        logger.info("Required apps identified: %s", required_apps)
         
-        # Step 3: Check user's connected apps in Supabase
-        logger.info(f"Checking connected apps for user: {request.user_id}")
-        connected_apps = await supabase_service.get_user_connected_apps(request.user_id)
-        
-        # Step 4: Build app status list
-        app_statuses = []
-        all_apps_connected = True
-        
-        for app_name in required_apps:
-            is_connected = app_name in connected_apps
-            app_statuses.append(AppStatus(
-                app_name=app_name,
-                is_connected=is_connected
-            ))
-            if not is_connected:
-                all_apps_connected = False
+        # Step 4: Build app status list (set membership instead of scanning the list per app)
+        connected_set = frozenset(connected_apps)
+        app_statuses = [
+            AppStatus(app_name=app_name, is_connected=app_name in connected_set)
+            for app_name in required_apps
+        ]
+        missing_apps = [app_name for app_name in required_apps if app_name not in connected_set]
         
         # Step 5: Prepare response
-        if all_apps_connected and required_apps:
-            response_status = "ready"
-            message = "All required apps are connected. Ready to execute workflow."
-        elif not required_apps:
+        if not required_apps:
             response_status = "no_apps_required"
             message = "No external apps required for this workflow."
+        elif not missing_apps:
+            response_status = "ready"
+            message = "All required apps are connected. Ready to execute workflow."
         else:
             response_status = "missing_apps"
-            missing_apps = [app.app_name for app in app_statuses if not app.is_connected]
             message = f"Missing connections: {', '.join(missing_apps)}. Please connect these apps first."
         
-        logger.info(f"Prompt processing complete. Status: {response_status}")
+        logger.info("Prompt processing complete. Status: %s", response_status)
         
-        return PromptResponse(
+        return _model_response(PromptResponse(
             status=response_status,
             message=message,
             required_apps=app_statuses,
             workflow_id=gemini_response.get("workflow_id"),
             gemini_analysis=gemini_response
-        )
+        ))
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing prompt: {str(e)}")
+        logger.exception("Error processing prompt")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=HTTP_500,
             detail=f"Error processing prompt: {str(e)}"
         )
 
@@ -242,68 +372,76 @@ async def connect_app(request: ConnectAppRequest):
     5. Return credential ID
     """
     try:
-        logger.info(f"Connecting app {request.app_name} for user: {request.user_id}")
+        logger.info("Connecting app %s for user: %s", request.app_name, request.user_id)
         
         # Step 1: Validate credentials
         if not request.credentials.access_token:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
+                status_code=HTTP_400,
                 detail="Access token is required"
             )
         
-        # Step 2: Store credentials in Supabase
-        logger.info(f"Storing credentials for {request.app_name}")
-        credential_id = await supabase_service.store_user_credentials(
-            user_id=request.user_id,
-            app_name=request.app_name,
-            app_type=request.app_type,
-            credentials=request.credentials.dict(),
-            metadata=request.metadata.dict()
+        # Dump once and share between both writes; unset optional fields are dropped
+        credentials = request.credentials.model_dump(mode="json", exclude_none=True)
+        metadata = request.metadata.model_dump(mode="json", exclude_none=True)
+        
+        # Step 2 & 3: Store credentials in Supabase and create/update the n8n
+        # credential for this user concurrently; they are independent writes
+        logger.info("Storing credentials for %s", request.app_name)
+        credential_id, n8n_credential_id = await asyncio.gather(
+            supabase_service.store_user_credentials(
+                user_id=request.user_id,
+                app_name=request.app_name,
+                app_type=request.app_type,
+                credentials=credentials,
+                metadata=metadata
+            ),
+            n8n_service.create_user_credential(
+                user_id=request.user_id,
+                app_type=request.app_type,
+                credentials=credentials,
+                credential_name=f"{request.app_type}_{request.user_id}"
+            ),
+            return_exceptions=True
         )
         
-        if not credential_id:
+        if isinstance(credential_id, BaseException) or not credential_id:
+            if isinstance(credential_id, BaseException):
+                logger.error("Error storing credentials: %s", credential_id)
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                status_code=HTTP_500,
                 detail="Failed to store credentials"
             )
         
-        # Step 3: Create/update n8n credentials for this user
-        logger.info(f"Creating n8n credentials for user {request.user_id}")
-        n8n_credential_id = await supabase_service.store_user_credentials(
-            user_id=request.user_id,
-            app_name=request.app_name,  # You can change this as needed
-            app_type=request.app_type,
-            credentials=request.credentials.dict(),
-            metadata={}  # Adjust this based on what metadata needs to be stored
-        )
+        proxy_service.invalidate_credentials(request.user_id, request.app_type)
         
-        if not n8n_credential_id:
-            logger.warning(f"Failed to create n8n credential, but Supabase storage succeeded")
+        if isinstance(n8n_credential_id, BaseException) or not n8n_credential_id:
+            logger.warning("Failed to create n8n credential, but Supabase storage succeeded")
         
-        logger.info(f"App connected successfully: {request.app_name}")
+        logger.info("App connected successfully: %s", request.app_name)
         
-        return ConnectAppResponse(
+        return _model_response(ConnectAppResponse(
             success=True,
             message="App connected successfully",
             credential_id=credential_id,
             app_name=request.app_name
-        )
+        ))
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error connecting app: {str(e)}")
-        return ConnectAppResponse(
+        logger.exception("Error connecting app")
+        return _model_response(ConnectAppResponse(
             success=False,
             message="Failed to connect app",
             credential_id=None,
             app_name=request.app_name,
             error=str(e)
-        )
+        ))
 
 
 @app.post("/execute-workflow", response_model=ExecuteWorkflowResponse)
-async def execute_workflow(request: ExecuteWorkflowRequest):
+async def execute_workflow(request: ExecuteWorkflowRequest, no_cache: bool = False):
     """
     Execute workflow by analyzing prompt with Gemini and calling helper functions directly.
     No n8n dependency - everything runs in the MCP server.
@@ -313,206 +451,332 @@ async def execute_workflow(request: ExecuteWorkflowRequest):
     2. If workflow found in DB, use its stored structure
     3. If not found or no workflow_id, analyze prompt with Gemini to get function calls
     4. Fetch credentials once per app (optimization)
-    5. Execute function calls in sequence with proper error handling
+    5. Execute function calls, running steps without data dependencies concurrently
     6. Save workflow to user_workflows if it was newly generated
+    
+    Gemini plans are cached per prompt and connected-app set; pass ?no_cache=true to bypass it.
     """
     try:
-        logger.info(f"Executing workflow for user: {request.user_id}")
-        
-        workflow_found = False
-        workflow_data = None
-        prompt = None
-        
-        if request.workflow_id:
-            logger.info(f"Attempting to fetch workflow by ID: {request.workflow_id}")
-            workflow = await supabase_service.get_workflow(request.workflow_id, request.user_id)
-            if workflow:
-                workflow_found = True
-                workflow_data = workflow
-                prompt = workflow.get("prompt") or workflow.get("description") or workflow.get("name", "")
-                logger.info(f"Workflow {request.workflow_id} found in database")
-            else:
-                logger.warning(f"Workflow {request.workflow_id} not found in database")
+        logger.info("Executing workflow for user: %s", request.user_id)
         
-        if request.prompt:
-            prompt = request.prompt
-            logger.info("Using prompt from request")
-        
-        if not prompt or prompt.strip() == "":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Either workflow_id must exist in database or prompt must be provided"
-            )
-        
-        logger.info(f"Analyzing prompt and generating function calls with Gemini. Prompt: '{prompt[:100]}...'")
-        
-        connected_apps = await supabase_service.get_user_connected_apps(request.user_id)
-        logger.info(f"User has {len(connected_apps)} connected apps: {connected_apps}")
-        
-        available_functions = get_functions_for_apps(connected_apps)
-        
-        function_plan = await gemini_service.analyze_prompt_with_functions(
-            prompt,
-            available_functions
-        )
+        prompt, workflow_found, function_plan = await _plan_workflow(request, use_cache=not no_cache)
         
         function_calls = function_plan.get("function_calls", [])
         reasoning = function_plan.get("reasoning", "")
         required_apps = function_plan.get("required_apps", [])
         
         if not function_calls:
-            return ExecuteWorkflowResponse(
+            return _model_response(ExecuteWorkflowResponse(
                 status="error",
                 message="No function calls generated. Please provide more details in your prompt.",
                 results=[],
                 reasoning=reasoning
-            )
-        
-        logger.info(f"Generated {len(function_calls)} function calls to execute")
-        
-        app_credentials_cache = {}
-        for app in required_apps:
-            try:
-                credentials = await supabase_service.get_user_app_credentials(
-                    user_id=request.user_id,
-                    app_name=app
-                )
-                if credentials:
-                    app_credentials_cache[app] = credentials
-                    logger.info(f"Cached credentials for {app}")
-                else:
-                    logger.warning(f"No credentials found for {app}")
-            except Exception as e:
-                logger.error(f"Error fetching credentials for {app}: {str(e)}")
+            ))
         
-        results = []
-        stored_results = {}
-        
-        for i, call in enumerate(function_calls):
-            app = call.get("app")
-            function = call.get("function")
-            parameters = call.get("parameters", {})
-            
-            if request.parameters:
-                parameters = {**parameters, **request.parameters}
-            
-            store_as = call.get("store_result_as")
-            
-            logger.info(f"Executing step {i+1}/{len(function_calls)}: {app}.{function}")
-            logger.info(f"Parameters before resolution: {parameters}")
-            
-            parameters = _resolve_parameters(parameters, stored_results)
-            logger.info(f"Parameters after resolution: {parameters}")
-            
-            try:
-                result = await proxy_service.execute_function_call_with_credentials(
-                    user_id=request.user_id,
-                    app_name=app,
-                    function_name=function,
-                    parameters=parameters,
-                    cached_credentials=app_credentials_cache.get(app)
-                )
-                
-                if result.get("success", False):
-                    results.append({
-                        "step": i + 1,
-                        "call": f"{app}.{function}",
-                        "status": "success",
-                        "result": result
-                    })
-                    
-                    if store_as:
-                        stored_results[store_as] = result
-                        logger.info(f"Stored result as '{store_as}': {result}")
-                else:
-                    error_msg = result.get("error", "Unknown error")
-                    logger.error(f"Function returned error: {error_msg}")
-                    results.append({
-                        "step": i + 1,
-                        "call": f"{app}.{function}",
-                        "status": "error",
-                        "error": error_msg
-                    })
-                    
-            except Exception as e:
-                logger.error(f"Error executing {app}.{function}: {str(e)}", exc_info=True)
-                results.append({
-                    "step": i + 1,
-                    "call": f"{app}.{function}",
-                    "status": "error",
-                    "error": str(e)
-                })
+        results = [
+            step_result
+            async for step_result in _run_workflow_steps(request, function_calls, required_apps)
+        ]
+        results.sort(key=lambda r: r["step"])
         
         if not workflow_found and request.workflow_id:
-            logger.info(f"Saving newly generated workflow {request.workflow_id} to user_workflows")
-            
-            workflow_name = prompt[:50] + "..." if len(prompt) > 50 else prompt
-            workflow_description = f"Custom workflow: {prompt[:200]}"
-            
-            await supabase_service.save_user_workflow(
-                user_id=request.user_id,
-                workflow_id=request.workflow_id,
-                name=workflow_name,
-                description=workflow_description,
-                prompt=prompt,
-                required_apps=required_apps,
-                category="custom"
-            )
-            logger.info("Workflow saved successfully for future reuse")
+            await _save_generated_workflow(request, prompt, required_apps)
         
         successful_steps = sum(1 for r in results if r.get("status") == "success")
         
-        logger.info(f"Workflow execution complete: {successful_steps}/{len(results)} steps successful")
+        logger.info("Workflow execution complete: %d/%d steps successful", successful_steps, len(results))
         
-        return ExecuteWorkflowResponse(
+        return _model_response(ExecuteWorkflowResponse(
             status="success" if successful_steps == len(results) else "partial_success",
             message=f"Executed {successful_steps}/{len(results)} steps successfully",
             results=results,
             reasoning=reasoning
-        )
+        ))
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error executing workflow: {str(e)}", exc_info=True)
+        logger.exception("Error executing workflow")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=HTTP_500,
             detail=f"Error executing workflow: {str(e)}"
         )
 
 
+@app.post("/execute-workflow/stream")
+async def execute_workflow_stream(request: ExecuteWorkflowRequest, no_cache: bool = False):
+    """
+    Same as /execute-workflow, but streams each step result as a Server-Sent
+    Event as soon as it completes, followed by a final "summary" event.
+    Invalid requests (missing prompt, etc.) are still returned as normal HTTP
+    errors; any other planning failure is reported as an "error" event.
+    """
+    logger.info("Executing streamed workflow for user: %s", request.user_id)
+    
+    planning_error = None
+    try:
+        prompt, workflow_found, function_plan = await _plan_workflow(request, use_cache=not no_cache)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error planning streamed workflow")
+        planning_error = e
+        prompt, workflow_found, function_plan = None, False, {}
+    
+    function_calls = function_plan.get("function_calls", [])
+    reasoning = function_plan.get("reasoning", "")
+    required_apps = function_plan.get("required_apps", [])
+    
+    async def event_stream():
+        if planning_error is not None:
+            yield b"event: error\ndata: " + orjson.dumps({"error": str(planning_error)}) + b"\n\n"
+            return
+        
+        successful_steps = 0
+        total_steps = 0
+        try:
+            if function_calls:
+                async for step_result in _run_workflow_steps(request, function_calls, required_apps):
+                    total_steps += 1
+                    if step_result.get("status") == "success":
+                        successful_steps += 1
+                    yield b"data: " + orjson.dumps(step_result) + b"\n\n"
+                
+                if not workflow_found and request.workflow_id:
+                    await _save_generated_workflow(request, prompt, required_apps)
+                
+                status_value = "success" if successful_steps == total_steps else "partial_success"
+                message = f"Executed {successful_steps}/{total_steps} steps successfully"
+            else:
+                status_value = "error"
+                message = "No function calls generated. Please provide more details in your prompt."
+            
+            yield b"event: summary\ndata: " + orjson.dumps({
+                "status": status_value,
+                "message": message,
+                "successful_steps": successful_steps,
+                "total": total_steps,
+                "reasoning": reasoning
+            }) + b"\n\n"
+        except Exception as e:
+            logger.exception("Error executing streamed workflow")
+            yield b"event: error\ndata: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+    
+    # Explicit identity encoding keeps GZipMiddleware from buffering events
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"}
+    )
+
+
+async def _plan_workflow(request: ExecuteWorkflowRequest, use_cache: bool = True) -> Tuple[str, bool, Dict[str, Any]]:
+    """
+    Resolve the prompt for a workflow request and ask Gemini for its function calls.
+    
+    Returns:
+        Tuple of (prompt, whether the workflow was found in the database, Gemini plan)
+    """
+    workflow_found = False
+    prompt = None
+    
+    if request.workflow_id:
+        logger.info("Attempting to fetch workflow by ID: %s", request.workflow_id)
+        workflow = await supabase_service.get_workflow(request.workflow_id, request.user_id)
+        if workflow:
+            workflow_found = True
+            prompt = workflow.get("prompt") or workflow.get("description") or workflow.get("name", "")
+            logger.info("Workflow %s found in database", request.workflow_id)
+        else:
+            logger.warning("Workflow %s not found in database", request.workflow_id)
+    
+    if request.prompt:
+        prompt = request.prompt
+        logger.info("Using prompt from request")
+    
+    if not prompt or prompt.strip() == "":
+        raise HTTPException(
+            status_code=HTTP_400,
+            detail="Either workflow_id must exist in database or prompt must be provided"
+        )
+    
+    logger.info("Analyzing prompt and generating function calls with Gemini. Prompt: '%s...'", prompt[:100])
+    
+    connected_apps = await supabase_service.get_user_connected_apps(request.user_id)
+    logger.info("User has %d connected apps: %s", len(connected_apps), connected_apps)
+    
+    available_functions = get_functions_for_app_set(connected_apps)
+    
+    function_plan = await gemini_service.analyze_prompt_with_functions(
+        prompt,
+        available_functions,
+        use_cache=use_cache
+    )
+    
+    if function_plan.get("function_calls"):
+        logger.info("Generated %d function calls to execute", len(function_plan["function_calls"]))
+    
+    return prompt, workflow_found, function_plan
+
+
+async def _run_workflow_steps(
+    request: ExecuteWorkflowRequest,
+    function_calls: List[FunctionCall],
+    required_apps: List[str]
+):
+    """
+    Execute a workflow's function calls and yield each step result as it finishes.
+    Steps that don't reference each other's stored results run concurrently,
+    one dependency level at a time.
+    """
+    # Fetch credentials for every required app in one query instead of one per app
+    app_credentials_cache = await supabase_service.get_user_apps_credentials(
+        user_id=request.user_id,
+        app_names=required_apps
+    )
+    for app in required_apps:
+        if app in app_credentials_cache:
+            logger.info("Cached credentials for %s", app)
+        else:
+            logger.warning("No credentials found for %s", app)
+    
+    stored_results = {}
+    
+    async def run_step(i: int, call: FunctionCall) -> Dict[str, Any]:
+        app = call.app
+        function = call.function
+        parameters = call.parameters
+        
+        if request.parameters:
+            parameters = {**parameters, **request.parameters}
+        
+        logger.info("Executing step %d/%d: %s.%s", i + 1, len(function_calls), app, function)
+        logger.info("Parameters before resolution: %s", parameters)
+        
+        parameters = _resolve_parameters(parameters, stored_results)
+        logger.info("Parameters after resolution: %s", parameters)
+        
+        try:
+            result = await proxy_service.execute_function_call_with_credentials(
+                user_id=request.user_id,
+                app_name=app,
+                function_name=function,
+                parameters=parameters,
+                cached_credentials=app_credentials_cache.get(app)
+            )
+            
+            if result.get("success", False):
+                return {
+                    "step": i + 1,
+                    "call": f"{app}.{function}",
+                    "status": "success",
+                    "result": result
+                }
+            
+            error_msg = result.get("error", "Unknown error")
+            logger.error("Function returned error: %s", error_msg)
+            return {
+                "step": i + 1,
+                "call": f"{app}.{function}",
+                "status": "error",
+                "error": error_msg
+            }
+                
+        except Exception as e:
+            logger.error("Error executing %s.%s: %s", app, function, e, exc_info=True)
+            return {
+                "step": i + 1,
+                "call": f"{app}.{function}",
+                "status": "error",
+                "error": str(e)
+            }
+    
+    for level in _plan_step_levels(function_calls, request.parameters):
+        level_results = {}
+        for finished in asyncio.as_completed([run_step(i, function_calls[i]) for i in level]):
+            step_result = await finished
+            level_results[step_result["step"] - 1] = step_result
+            yield step_result
+        
+        # Publish stored results in step order once the whole level is done
+        for i in level:
+            store_as = function_calls[i].store_result_as
+            step_result = level_results[i]
+            if store_as and step_result["status"] == "success":
+                stored_results[store_as] = step_result["result"]
+                logger.info("Stored result as '%s': %s", store_as, step_result["result"])
+
+
+async def _save_generated_workflow(request: ExecuteWorkflowRequest, prompt: str, required_apps: List[str]):
+    """Persist a newly generated workflow to user_workflows for future reuse"""
+    logger.info("Saving newly generated workflow %s to user_workflows", request.workflow_id)
+    
+    workflow_name = prompt[:50] + "..." if len(prompt) > 50 else prompt
+    workflow_description = f"Custom workflow: {prompt[:200]}"
+    
+    await supabase_service.save_user_workflow(
+        user_id=request.user_id,
+        workflow_id=request.workflow_id,
+        name=workflow_name,
+        description=workflow_description,
+        prompt=prompt,
+        required_apps=required_apps,
+        category="custom"
+    )
+    logger.info("Workflow saved successfully for future reuse")
+
+
 @app.get("/workflow/{workflow_id}/status")
 async def get_workflow_status(workflow_id: str, user_id: str):
     """Get the status of a workflow execution"""
     try:
-        logger.info(f"Fetching workflow status: {workflow_id}")
-        
-        # Get status from n8n
-        n8n_status = await proxy_service.get_execution_status(workflow_id)
+        logger.info("Fetching workflow status: %s", workflow_id)
         
-        # Get saved execution from Supabase
-        db_execution = await supabase_service.get_workflow_execution(workflow_id, user_id)
+        # Get status from n8n and the saved execution from Supabase concurrently
+        n8n_status, db_execution = await asyncio.gather(
+            n8n_service.get_execution_status(workflow_id),
+            supabase_service.get_workflow_execution(workflow_id, user_id)
+        )
         
-        return {
+        # Third-party payloads are already plain JSON; skip jsonable_encoder
+        return ORJSONResponse(content={
             "status": "success",
             "workflow_id": workflow_id,
             "n8n_status": n8n_status,
             "database_record": db_execution
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error fetching workflow status: {str(e)}")
+        logger.exception("Error fetching workflow status")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=HTTP_500,
             detail=f"Error fetching workflow status: {str(e)}"
         )
 
 
-@app.post("/proxy/{app_name}/{action}", response_model=ProxyResponse)
+@app.post(
+    "/proxy/{app_name}/{action}",
+    response_model=ProxyResponse,
+    responses={200: {
+        "content": {"application/x-ndjson": {
+            "schema": {"type": "object", "description": "One item of the action's result list per line"}
+        }},
+        "description": "ProxyResponse, or an NDJSON item stream for list actions when requested via Accept"
+    }, 422: {"model": ProxyResponse, "description": "Invalid request body"}},
+    # The body is parsed by hand below; keep ProxyRequest as the documented schema
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": ProxyRequest.model_json_schema()}}
+        }
+    }
+)
 async def proxy_app_request(
     app_name: str,
     action: str,
-    request: ProxyRequest
+    http_request: Request
 ):
     """
     Proxy requests to third-party APIs using user-specific OAuth tokens
@@ -525,135 +789,243 @@ async def proxy_app_request(
     3. Make API call to third-party service using user's OAuth tokens
     4. Return response to n8n workflow
     
-    Supported apps and actions:
+    Supported apps and actions (helper function names are accepted too):
     - gmail: fetchEmails, sendEmail
     - slack: postMessage, listChannels
-    - notion: createPage, searchPages
+    - notion: createPage, queryDatabase
     - calendar: createEvent, listEvents
-    - gdrive: listFiles, uploadFile
+    - discord: sendMessage, getChannel
+    
+    The body is read with orjson rather than validated through ProxyRequest, since
+    the free-form payload would otherwise get a full recursive Pydantic pass on
+    this high-traffic route. Only user_id and payload are checked.
+    
+    Clients sending `Accept: application/x-ndjson` to a list action (fetchEmails,
+    listEvents, listChannels, queryDatabase) get the result list streamed one
+    JSON document per line instead of a single buffered envelope.
     """
+    # Input validation failures all get 422 with the ProxyResponse body shape
     try:
-        logger.info(f"[DEBUG] Received proxy request - app_name: '{app_name}', action: '{action}'")
-        logger.info(f"[DEBUG] Request body - user_id: '{request.user_id}', payload: {request.payload}")
-        
-        if not request.user_id or request.user_id.strip() == "":
-            logger.error(f"[ERROR] user_id is missing from request body!")
-            return ProxyResponse(
-                success=False,
-                error="user_id is required in request body"
-            )
-        
-        logger.info(f"Proxy request: {app_name}/{action} for user: {request.user_id}")
+        body = orjson.loads(await http_request.body())
+    except orjson.JSONDecodeError:
+        return _proxy_error("Request body must be valid JSON", status_code=HTTP_422)
+    if not isinstance(body, dict):
+        return _proxy_error("Request body must be a JSON object", status_code=HTTP_422)
+    
+    user_id = body.get("user_id")
+    payload = body.get("payload") or {}
+    if not isinstance(user_id, str) or user_id.strip() == "":
+        logger.warning("Proxy request without user_id: %s/%s", app_name, action)
+        return _proxy_error("user_id is required in request body", status_code=HTTP_422)
+    if not isinstance(payload, dict):
+        return _proxy_error("payload must be a JSON object", status_code=HTTP_422)
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received proxy request - app_name: '%s', action: '%s'", app_name, action)
+        logger.debug("Request body - user_id: '%s', payload: %s", user_id, payload)
+    
+    try:
+        logger.info("Proxy request: %s/%s for user: %s", app_name, action, user_id)
         
         result = await proxy_service.proxy_request(
-            user_id=request.user_id,
+            user_id=user_id,
             app_name=app_name,
             action=action,
-            payload=request.payload
+            payload=payload
         )
         
         if result.get("success"):
-            return ProxyResponse(
-                success=True,
-                data=result
-            )
+            stream_key = result.get("stream_key")
+            if stream_key and "application/x-ndjson" in http_request.headers.get("accept", ""):
+                items = result["data"].get(stream_key)
+                if isinstance(items, list):
+                    return StreamingResponse(_ndjson_lines(items), media_type="application/x-ndjson")
+            # Proxied payloads are already JSON-safe; serialize straight through orjson
+            return ORJSONResponse(content={
+                "success": True,
+                "data": result.get("data"),
+                "error": None
+            })
         else:
-            return ProxyResponse(
-                success=False,
-                error=result.get("error", "Unknown error occurred")
-            )
+            return _proxy_error(result.get("error", "Unknown error occurred"))
             
     except Exception as e:
-        logger.error(f"Error in proxy request: {str(e)}")
-        logger.exception(e)  # Add full exception traceback
-        return ProxyResponse(
-            success=False,
-            error=str(e)
-        )
+        logger.exception("Error in proxy request")
+        return _proxy_error(str(e))
+
+
+def _proxy_error(error: str, status_code: int = 200) -> ORJSONResponse:
+    """ProxyResponse-shaped failure body"""
+    return ORJSONResponse(
+        status_code=status_code,
+        content={"success": False, "data": None, "error": error}
+    )
+
+
+async def _ndjson_lines(items: List[Any]):
+    """Yield each item as one newline-terminated JSON document"""
+    for item in items:
+        yield orjson.dumps(item) + b"\n"
+
+
+# {{ reference }} markers in step parameters and the separators inside a reference path
+_TEMPLATE_RE = re.compile(r'\{\{\s*([^}]+)\s*\}\}')
+_PATH_SPLIT_RE = re.compile(r'[.\[\]]')
+
+
+def _plan_step_levels(
+    function_calls: List[FunctionCall],
+    extra_parameters: Optional[Dict[str, Any]] = None
+) -> List[List[int]]:
+    """
+    Group step indices into levels that can run concurrently.
+    A step depends on every earlier step whose store_result_as it references,
+    either through {{ name... }} in its parameters or via use_results_from.
+    """
+    depends_on: List[set] = []
+    for i, call in enumerate(function_calls):
+        parameters = call.parameters
+        if extra_parameters:
+            parameters = {**parameters, **extra_parameters}
+        referenced = {
+            _PATH_SPLIT_RE.split(match.strip(), 1)[0].strip()
+            for match in _TEMPLATE_RE.findall(orjson.dumps(parameters, default=str).decode())
+        }
+        referenced.update(call.use_results_from or [])
+        depends_on.append({
+            j for j in range(i)
+            if function_calls[j].store_result_as in referenced
+        })
+    
+    levels = []
+    done: set = set()
+    pending = list(range(len(function_calls)))
+    while pending:
+        level = [i for i in pending if depends_on[i] <= done]
+        levels.append(level)
+        done.update(level)
+        pending = [i for i in pending if i not in done]
+    return levels
+
 
 def _resolve_parameters(parameters: Dict[str, Any], stored_results: Dict[str, Any]) -> Dict[str, Any]:
     """
     Resolve parameter references like {{ variable_name }} with stored results.
     Supports nested access like {{ emails.messages[0].id }} and {{ user.name }}
     Handles API responses with nested data structures.
+    References inside nested dicts/lists are resolved too; containers are only
+    copied when something in them actually changes, so parameters without any
+    references are returned as-is.
     """
-    import re
+    return _resolve_value(parameters, stored_results)
+
+
+def _resolve_value(value: Any, stored_results: Dict[str, Any]) -> Any:
+    """Copy-on-write resolution of {{ }} references anywhere inside value"""
+    if isinstance(value, str):
+        return _resolve_string(value, stored_results) if "{{" in value else value
     
-    resolved = {}
+    if isinstance(value, dict):
+        resolved = None
+        for key, item in value.items():
+            new_item = _resolve_value(item, stored_results)
+            if new_item is not item:
+                if resolved is None:
+                    resolved = dict(value)
+                resolved[key] = new_item
+        return value if resolved is None else resolved
     
-    for key, value in parameters.items():
-        if isinstance(value, str) and "{{" in value and "}}" in value:
-            pattern = r'\{\{\s*([^}]+)\s*\}\}'
-            matches = re.findall(pattern, value)
+    if isinstance(value, list):
+        resolved = None
+        for index, item in enumerate(value):
+            new_item = _resolve_value(item, stored_results)
+            if new_item is not item:
+                if resolved is None:
+                    resolved = list(value)
+                resolved[index] = new_item
+        return value if resolved is None else resolved
+    
+    return value
+
+
+def _resolve_string(value: str, stored_results: Dict[str, Any]) -> str:
+    """Substitute every {{ reference }} in a single string value"""
+    matches = _TEMPLATE_RE.findall(value)
+    if not matches:
+        return value
+    
+    for match in matches:
+        try:
+            parts = [p.strip() for p in _PATH_SPLIT_RE.split(match) if p.strip()]
             
-            for match in matches:
-                try:
-                    parts = re.split(r'\.|\[', match)
-                    parts = [p.rstrip(']').strip() for p in parts if p.strip()]
-                    
-                    result = stored_results
+            result = stored_results
+            
+            for i, part in enumerate(parts):
+                # Check if this part is an array index
+                if part.isdigit():
+                    index = int(part)
                     
-                    for i, part in enumerate(parts):
-                        # Check if this part is an array index
-                        if part.isdigit():
-                            index = int(part)
-                            
-                            if isinstance(result, list):
-                                if index < len(result):
-                                    result = result[index]
-                                else:
-                                    logger.error(f"Index {index} out of range for list of length {len(result)}")
-                                    result = None
-                                    break
-                            elif isinstance(result, dict):
-                                list_fields = ['messages', 'data', 'items', 'results', 'emails', 'events', 'files']
-                                found = False
-                                
-                                for field in list_fields:
-                                    if field in result and isinstance(result[field], list):
-                                        if index < len(result[field]):
-                                            result = result[field][index]
-                                            found = True
-                                            logger.info(f"Accessed {field}[{index}] from dict")
-                                            break
-                                
-                                if not found:
-                                    logger.error(f"Cannot access index {index} on dict. Available keys: {list(result.keys()) if isinstance(result, dict) else 'N/A'}")
-                                    result = None
-                                    break
-                            else:
-                                logger.error(f"Cannot access index {index} on type {type(result).__name__}")
-                                result = None
-                                break
+                    if isinstance(result, list):
+                        if index < len(result):
+                            result = result[index]
                         else:
-                            # Property access
-                            if isinstance(result, dict):
-                                result = result.get(part)
-                                if result is None:
-                                    logger.warning(f"Property '{part}' not found in dict. Available keys: {list(result.keys()) if isinstance(result, dict) else 'N/A'}")
-                                    break
-                            else:
-                                result = getattr(result, part, None)
-                                if result is None:
-                                    logger.warning(f"Property '{part}' not found on object")
+                            logger.error("Index %s out of range for list of length %d", index, len(result))
+                            result = None
+                            break
+                    elif isinstance(result, dict):
+                        list_fields = ['messages', 'data', 'items', 'results', 'emails', 'events', 'files']
+                        found = False
+                        
+                        for field in list_fields:
+                            if field in result and isinstance(result[field], list):
+                                if index < len(result[field]):
+                                    result = result[field][index]
+                                    found = True
+                                    logger.info("Accessed %s[%s] from dict", field, index)
                                     break
-                    
-                    if result is not None:
-                        replacement = str(result)
-                        value = re.sub(r'\{\{\s*' + re.escape(match) + r'\s*\}\}', replacement, value)
-                        logger.info(f"Resolved {{{{ {match} }}}} to: {replacement}")
-                    else:
-                        logger.warning(f"Could not resolve parameter reference: {match}")
                         
-                except Exception as e:
-                    logger.error(f"Error resolving parameter '{match}': {str(e)}", exc_info=True)
+                        if not found:
+                            logger.error("Cannot access index %s on dict. Available keys: %s", index, list(result.keys()) if isinstance(result, dict) else 'N/A')
+                            result = None
+                            break
+                    else:
+                        logger.error("Cannot access index %s on type %s", index, type(result).__name__)
+                        result = None
+                        break
+                else:
+                    # Property access
+                    if isinstance(result, dict):
+                        result = result.get(part)
+                        if result is None:
+                            logger.warning("Property '%s' not found in dict. Available keys: %s", part, list(result.keys()) if isinstance(result, dict) else 'N/A')
+                            break
+                    else:
+                        result = getattr(result, part, None)
+                        if result is None:
+                            logger.warning("Property '%s' not found on object", part)
+                            break
             
-            resolved[key] = value
-        else:
-            resolved[key] = value
+            if result is not None:
+                replacement = str(result)
+                value = re.sub(r'\{\{\s*' + re.escape(match) + r'\s*\}\}', replacement, value)
+                logger.info("Resolved {{ %s }} to: %s", match, replacement)
+            else:
+                logger.warning("Could not resolve parameter reference: %s", match)
+                
+        except Exception as e:
+            logger.error("Error resolving parameter '%s': %s", match, e, exc_info=True)
+
     
-    return resolved
+    return value
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        access_log=False
+    )
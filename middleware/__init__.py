@@ -0,0 +1,9 @@
+"""
+ASGI middleware used by the MCP server.
+"""
+
+from .cors_asgi import FastCORS
+
+__all__ = [
+    'FastCORS'
+]
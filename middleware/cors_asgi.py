@@ -0,0 +1,112 @@
+"""
+Minimal pure-ASGI CORS middleware.
+All header values are encoded once at startup and appended to responses as-is.
+"""
+
+from typing import Iterable, List, Tuple
+
+
+class FastCORS:
+    """CORS middleware with precomputed header bytes."""
+    
+    def __init__(
+        self,
+        app,
+        allow_origins: Iterable[str] = ("*",),
+        allow_methods: Iterable[str] = ("GET", "POST"),
+        allow_headers: Iterable[str] = ("*",),
+        allow_credentials: bool = False,
+        max_age: int = 600
+    ):
+        """
+        Args:
+            app: Wrapped ASGI application
+            allow_origins: Allowed origins, or "*" for any origin
+            allow_methods: Methods advertised to preflight requests
+            allow_headers: Request headers advertised to preflight requests, or "*"
+            allow_credentials: Whether to send Access-Control-Allow-Credentials
+            max_age: Seconds browsers may cache a preflight result
+        """
+        self.app = app
+        origins = list(allow_origins)
+        self.allow_all_origins = "*" in origins
+        self.allow_origins = frozenset(origin.encode("latin-1") for origin in origins)
+        headers = list(allow_headers)
+        self.allow_all_headers = "*" in headers
+        # Credentialed responses must echo the origin instead of "*"
+        self.echo_origin = allow_credentials or not self.allow_all_origins
+        
+        common: List[Tuple[bytes, bytes]] = []
+        if allow_credentials:
+            common.append((b"access-control-allow-credentials", b"true"))
+        if not self.allow_all_origins:
+            common.append((b"vary", b"Origin"))
+        self._simple_headers = common
+        
+        self._preflight_headers = common + [
+            (b"access-control-allow-methods", ", ".join(allow_methods).encode("latin-1")),
+            (b"access-control-max-age", str(max_age).encode("latin-1")),
+        ]
+        if not self.allow_all_headers:
+            self._preflight_headers.append(
+                (b"access-control-allow-headers", ", ".join(headers).encode("latin-1"))
+            )
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        origin = None
+        request_method = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+        
+        # Not a cross-origin request; nothing to add
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+        
+        allowed = self.allow_all_origins or origin in self.allow_origins
+        
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self._preflight(send, origin, allowed, request_headers)
+            return
+        
+        if not allowed:
+            await self.app(scope, receive, send)
+            return
+        
+        extra = [(b"access-control-allow-origin", self._origin_value(origin))] + self._simple_headers
+        
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + extra
+            await send(message)
+        
+        await self.app(scope, receive, send_with_cors)
+    
+    def _origin_value(self, origin: bytes) -> bytes:
+        return origin if self.echo_origin else b"*"
+    
+    async def _preflight(self, send, origin: bytes, allowed: bool, request_headers):
+        if not allowed:
+            status = 400
+            headers = [(b"content-type", b"text/plain; charset=utf-8")]
+            body = b"Disallowed CORS origin"
+        else:
+            status = 200
+            headers = [(b"access-control-allow-origin", self._origin_value(origin))] + self._preflight_headers
+            if self.allow_all_headers and request_headers is not None:
+                headers.append((b"access-control-allow-headers", request_headers))
+            headers.append((b"content-type", b"text/plain; charset=utf-8"))
+            body = b"OK"
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,56 +1,167 @@
 import os
-import json
+import asyncio
+import hashlib
 import logging
 import re
-from typing import Dict, Any, List, Optional
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+import orjson
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
 import google.generativeai as genai
+from cachetools import LRUCache, TTLCache
 
 logger = logging.getLogger(__name__)
 
 
-class GeminiService:
-    """Service for interacting with Gemini 2.5 Flash API"""
+@dataclass(slots=True)
+class FunctionCall:
+    """One validated step of a Gemini execution plan"""
+    step: int
+    app: str
+    function: str
+    parameters: Dict[str, Any] = field(default_factory=dict)
+    description: str = ""
+    store_result_as: Optional[str] = None
+    use_results_from: Optional[List[str]] = None
+
+# Characters that can change brace depth or string state while scanning JSON
+_JSON_STRUCTURAL_RE = re.compile(r'[{}"\\]')
+
+
+class _JsonObjectScanner:
+    """
+    Incremental brace-depth scan for the first {...} in a growing buffer.
+    Scan state is kept between feed() calls, so each character is visited once
+    however many chunks the buffer arrives in. Braces inside strings (and
+    escaped quotes) are ignored; only structural characters are visited.
+    """
     
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            logger.warning("GEMINI_API_KEY not found in environment variables")
-        else:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    __slots__ = ("start", "offset", "depth", "in_string", "escaped_at")
     
-    async def analyze_prompt(
-        self, 
-        prompt: str,
-        workflow_templates: Optional[List[Dict[str, Any]]] = None
-    ) -> Dict[str, Any]:
-        """
-        Send prompt to Gemini and analyze what apps are needed.
+    def __init__(self, start: int = -1):
+        self.start = start
+        self.offset = max(start, 0)
+        self.depth = 0
+        self.in_string = False
+        self.escaped_at = -1
+    
+    def feed(self, text: str) -> int:
+        """Scan text past the previous offset; return the index just past the object, or -1"""
+        if self.start == -1:
+            self.start = text.find("{", self.offset)
+            if self.start == -1:
+                self.offset = len(text)
+                return -1
+            self.offset = self.start
         
-        Args:
-            prompt: User's automation request
-            workflow_templates: List of available workflow templates from database
-            
-        Returns:
-            Dictionary containing either workflow_id (for existing templates) or workflow_json (for custom workflows)
-        """
-        try:
-            templates_section = ""
-            if workflow_templates and len(workflow_templates) > 0:
-                templates_section = "\n\nAVAILABLE WORKFLOW TEMPLATES:\n"
-                for template in workflow_templates:
-                    templates_section += f"""
-- ID: {template['id']}
-  Name: {template['name']}
-  Description: {template['description']}
-  Required Apps: {', '.join(template['required_apps'])}
-  Category: {template.get('category', 'general')}
-"""
-            
-            system_prompt = f"""You are an AI assistant for an automation platform called Blimp. 
+        for match in _JSON_STRUCTURAL_RE.finditer(text, self.offset):
+            ch = match.group()
+            pos = match.start()
+            if self.in_string:
+                if ch == "\\":
+                    # The character after a backslash is literal
+                    if self.escaped_at != pos:
+                        self.escaped_at = pos + 1
+                elif ch == '"' and self.escaped_at != pos:
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.offset = pos + 1
+                    return pos + 1
+        self.offset = len(text)
+        return -1
+
+
+def _json_object_end(text: str, start: int) -> int:
+    """Return the index just past the {...} that opens at text[start], or -1 if it never closes"""
+    return _JsonObjectScanner(start).feed(text)
+
+
+async def _close_stream(response: Any) -> None:
+    """Stop a partially read Gemini stream so the upstream call is released"""
+    # google-generativeai (pinned at 0.8.3 in requirements.txt) has no public close on
+    # AsyncGenerateContentResponse; its private _iterator is the gRPC call (or REST
+    # iterator). Re-check this attribute when upgrading the SDK.
+    call = getattr(response, "_iterator", None)
+    if hasattr(call, "cancel"):
+        call.cancel()
+    elif hasattr(call, "aclose"):
+        await call.aclose()
+    else:
+        logger.warning(
+            "Cannot close Gemini stream early: %s has no cancellable _iterator (SDK changed?)",
+            type(response).__name__
+        )
+
+# Apps recognised by the free-text fallback, keyed by their lowercase form
+_COMMON_APPS = {app.lower(): app for app in (
+    "Gmail", "Slack", "Google Sheets", "Google Drive", "Trello",
+    "Asana", "Notion", "Discord", "Twitter", "LinkedIn", "Salesforce",
+    "HubSpot", "Mailchimp", "Stripe", "PayPal", "Zoom", "Google Calendar",
+    "Dropbox", "GitHub", "Jira", "Airtable", "Zapier", "Monday.com"
+)}
+# One alternation over all names so the text is scanned once rather than once per app
+_COMMON_APPS_RE = re.compile("|".join(
+    re.escape(name) for name in sorted(_COMMON_APPS, key=len, reverse=True)
+))
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _digest(data: bytes) -> str:
+    """Short, stable content hash used for cache keys"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Fold case, whitespace and trailing punctuation so trivially different phrasings share a key"""
+    return _WHITESPACE_RE.sub(" ", prompt.casefold()).strip().rstrip(".!?")
+
+
+@lru_cache(maxsize=None)
+def _get_model(api_key: str) -> genai.GenerativeModel:
+    """Configure the SDK and build the model once per process (per API key)"""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-2.0-flash-exp')
+
+
+# Rendered prompt text per (app, function names); the registry is static, so
+# the same app/function set always renders to the same text
+_APP_FUNCTIONS_TEXT: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+
+
+def _describe_app_functions(app_name: str, functions: Dict[str, Dict[str, Any]]) -> str:
+    """Render one app's functions for the system prompt, memoized per app/function set"""
+    key = (app_name, tuple(functions))
+    text = _APP_FUNCTIONS_TEXT.get(key)
+    if text is None:
+        parts = [f"\n{app_name.upper()} Functions:\n"]
+        for func_name, func_info in functions.items():
+            parts.append(f"""
+- {func_name}:
+  Description: {func_info['description']}
+  Parameters: {orjson.dumps(func_info['parameters'], option=orjson.OPT_INDENT_2).decode()}
+  Returns: {func_info.get('returns', 'Result object')}
+""")
+        text = "".join(parts)
+        _APP_FUNCTIONS_TEXT[key] = text
+    return text
+
+
+# Static parts of the Gemini system prompts, assembled once at import;
+# only the templates/functions sections and the user prompt vary per call
+_TEMPLATE_PROMPT_HEAD = """You are an AI assistant for an automation platform called Blimp. 
 Analyze the user's request and determine the best workflow solution.
 
-{templates_section}
+"""
+
+_TEMPLATE_PROMPT_BODY = """
 
 TASK:
 1. If the user's request matches one of the available workflow templates above, return the workflow_id
@@ -60,93 +171,22 @@ IMPORTANT: Respond ONLY with valid JSON. No markdown, no explanations, just the
 RESPONSE FORMAT:
 
 For matching existing template:
-{{
+{
   "match_type": "existing_template",
   "workflow_id": "template-id-here",
   "required_apps": ["app1", "app2"],
   "confidence": 0.95,
   "reasoning": "Brief explanation of why this template matches"
-}}
+}
 
-User request: {prompt}"""
-            
-            response = self.model.generate_content(
-                system_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,
-                )
-            )
-            
-            response_text = response.text.strip()
-            
-            logger.info(f"Raw Gemini response: {response_text[:500]}")
-            
-            parsed_response = self._extract_and_parse_json(response_text)
-            
-            parsed_response = self._validate_workflow_response(parsed_response, prompt)
-            
-            logger.info(f"Gemini analysis complete: {json.dumps(parsed_response, indent=2)[:500]}")
-            return parsed_response
-            
-        except Exception as e:
-            logger.error(f"Error calling Gemini API: {str(e)}", exc_info=True)
-            return {
-                "match_type": "error",
-                "required_apps": [],
-                "error": str(e),
-                "reasoning": "Error occurred during analysis"
-            }
-    
-    async def analyze_prompt_with_functions(
-        self, 
-        prompt: str,
-        available_functions: Dict[str, Dict[str, Any]]
-    ) -> Dict[str, Any]:
-        """
-        Analyze user prompt and return function calls to execute.
-        This is the PRIMARY method for workflow execution - it generates the complete execution plan.
-        
-        Args:
-            prompt: User's automation request
-            available_functions: Dict of available functions for user's connected apps
-            
-        Returns:
-            Dictionary containing:
-            - workflow_type: "simple" or "complex"
-            - function_calls: Array of function calls to execute in sequence
-            - required_apps: List of apps needed for this workflow
-            - reasoning: Explanation of the workflow logic
-        """
-        try:
-            if not prompt or prompt.strip() == "":
-                logger.error("Empty prompt provided to analyze_prompt_with_functions")
-                return {
-                    "workflow_type": "error",
-                    "function_calls": [],
-                    "required_apps": [],
-                    "reasoning": "No prompt provided. Please describe what you want to automate."
-                }
-            
-            functions_description = "\n\nAVAILABLE FUNCTIONS (based on user's connected apps):\n"
-            
-            if not available_functions:
-                logger.warning("No available functions provided - user may not have connected apps")
-                functions_description += "\nNOTE: User has no connected apps. Workflow cannot be executed.\n"
-            else:
-                for app_name, functions in available_functions.items():
-                    functions_description += f"\n{app_name.upper()} Functions:\n"
-                    for func_name, func_info in functions.items():
-                        functions_description += f"""
-- {func_name}:
-  Description: {func_info['description']}
-  Parameters: {json.dumps(func_info['parameters'], indent=4)}
-  Returns: {func_info.get('returns', 'Result object')}
-"""
-            
-            system_prompt = f"""You are an AI assistant for an automation platform called Blimp.
+User request: """
+
+_FUNCTION_PROMPT_HEAD = """You are an AI assistant for an automation platform called Blimp.
 Analyze the user's request and determine which function calls to make to fulfill their request.
 
-{functions_description}
+"""
+
+_FUNCTION_PROMPT_RULES = """
 
 IMPORTANT RULES:
 1. ONLY use functions from the AVAILABLE FUNCTIONS list above
@@ -159,48 +199,48 @@ IMPORTANT RULES:
 8. Store intermediate results with descriptive names for use in later steps
 
 RESPONSE FORMAT (JSON only, no markdown, no code blocks):
-{{
+{
   "workflow_type": "simple" | "complex",
   "function_calls": [
-    {{
+    {
       "step": 1,
       "app": "gmail",
       "function": "list_messages",
-      "parameters": {{
+      "parameters": {
         "query": "is:unread",
         "max_results": 10
-      }},
+      },
       "store_result_as": "recent_emails",
       "description": "Fetch list of recent email IDs"
-    }},
-    {{
+    },
+    {
       "step": 2,
       "app": "gmail",
       "function": "get_message",
-      "parameters": {{
-        "message_id": "{{{{ recent_emails.messages[0].id }}}}"
-      }},
+      "parameters": {
+        "message_id": "{{ recent_emails.messages[0].id }}"
+      },
       "store_result_as": "first_email_details",
       "use_results_from": ["recent_emails"],
       "description": "Get details of first email"
-    }},
-    {{
+    },
+    {
       "step": 3,
       "app": "calendar",
       "function": "create_event",
-      "parameters": {{
-        "summary": "{{{{ first_email_details.subject }}}}",
-        "description": "{{{{ first_email_details.body }}}}",
+      "parameters": {
+        "summary": "{{ first_email_details.subject }}",
+        "description": "{{ first_email_details.body }}",
         "start_time": "2025-01-20T10:00:00Z",
         "end_time": "2025-01-20T11:00:00Z"
-      }},
+      },
       "use_results_from": ["first_email_details"],
       "description": "Create calendar event from email"
-    }}
+    }
   ],
   "required_apps": ["gmail", "calendar"],
   "reasoning": "Fetch unread emails, get details of first email, create calendar event with email content"
-}}
+}
 
 FIELD EXPLANATIONS:
 - workflow_type: "simple" for single action, "complex" for multi-step workflows
@@ -216,45 +256,307 @@ FIELD EXPLANATIONS:
 - reasoning: Brief explanation of the overall workflow logic
 
 PARAMETER REFERENCE SYNTAX:
-Use {{{{ variable_name.field }}}} or {{{{ variable_name.array[index].field }}}} to reference stored results.
+Use {{ variable_name.field }} or {{ variable_name.array[index].field }} to reference stored results.
 Examples:
-- {{{{ recent_emails.messages[0].id }}}} - First email's ID from messages array
-- {{{{ first_email_details.subject }}}} - Email subject from stored details
-- {{{{ user_data.email }}}} - User's email from stored data
+- {{ recent_emails.messages[0].id }} - First email's ID from messages array
+- {{ first_email_details.subject }} - Email subject from stored details
+- {{ user_data.email }} - User's email from stored data
 
 IMPORTANT: When working with list operations (like emails):
 1. FIRST call list_messages to get message IDs
 2. THEN call get_message for each specific message ID you need
-3. The list_messages returns: {{success: true, messages: [{{id: "...", threadId: "..."}}, ...]}}
-4. Access message IDs with: {{{{ recent_emails.messages[0].id }}}}
+3. The list_messages returns: {success: true, messages: [{id: "...", threadId: "..."}, ...]}
+4. Access message IDs with: {{ recent_emails.messages[0].id }}
 
 ===== USER REQUEST =====
-{prompt}
+"""
+
+_FUNCTION_PROMPT_TAIL = """
 ========================
 
 Analyze the above user request and generate the appropriate function calls. Respond with ONLY the JSON object."""
+
+# Rendered "AVAILABLE WORKFLOW TEMPLATES" blocks, keyed by the template-set digest;
+# the template list only changes when the Supabase cache refreshes
+_TEMPLATE_SECTIONS: LRUCache = LRUCache(maxsize=32)
+
+
+def _render_templates_section(workflow_templates: Optional[List[Dict[str, Any]]], templates_version: str) -> str:
+    """Render the templates block of the template-matching prompt, memoized per template set"""
+    section = _TEMPLATE_SECTIONS.get(templates_version)
+    if section is None:
+        parts = []
+        if workflow_templates and len(workflow_templates) > 0:
+            parts.append("\n\nAVAILABLE WORKFLOW TEMPLATES:\n")
+            for template in workflow_templates:
+                parts.append(f"""
+- ID: {template['id']}
+  Name: {template['name']}
+  Description: {template['description']}
+  Required Apps: {', '.join(template['required_apps'])}
+  Category: {template.get('category', 'general')}
+""")
+        section = "".join(parts)
+        _TEMPLATE_SECTIONS[templates_version] = section
+    return section
+
+
+def _build_function_prompt(prompt: str, available_functions: Dict[str, Dict[str, Any]]) -> str:
+    """Assemble the function-planning system prompt from the memoized per-app sections"""
+    parts = [_FUNCTION_PROMPT_HEAD, "\n\nAVAILABLE FUNCTIONS (based on user's connected apps):\n"]
+    for app_name, functions in available_functions.items():
+        parts.append(_describe_app_functions(app_name, functions))
+    parts += (_FUNCTION_PROMPT_RULES, prompt, _FUNCTION_PROMPT_TAIL)
+    return "".join(parts)
+
+
+# Output shape and defaults of _validate_workflow_response per match_type
+_WORKFLOW_RESPONSE_DEFAULTS = {
+    "existing_template": {
+        "match_type": "existing_template",
+        "workflow_id": None,
+        "required_apps": [],
+        "confidence": 0.8,
+        "reasoning": "Template matched"
+    },
+    "custom_workflow": {
+        "match_type": "custom_workflow",
+        "workflow_json": {},
+        "required_apps": [],
+        "reasoning": "Custom workflow generated"
+    },
+    "error": {
+        "match_type": "error",
+        "required_apps": [],
+        "error": "Unknown response format",
+        "reasoning": "Could not determine workflow type"
+    },
+}
+
+
+class GeminiService:
+    """Service for interacting with Gemini 2.5 Flash API"""
+    
+    def __init__(self):
+        # Finished analyses and in-flight Gemini calls, keyed by prompt + template set
+        self._result_cache: TTLCache = TTLCache(maxsize=10_000, ttl=int(os.getenv("GEMINI_CACHE_TTL", "300")))
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Cap outstanding Gemini requests so bursts queue here instead of hitting 429s
+        self._gemini_semaphore = asyncio.Semaphore(int(os.getenv("GEMINI_CONCURRENCY", "8")))
+        
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            logger.warning("GEMINI_API_KEY not found in environment variables")
+        else:
+            self.model = _get_model(self.api_key)
+    
+    async def analyze_prompt(
+        self, 
+        prompt: str,
+        workflow_templates: Optional[List[Dict[str, Any]]] = None,
+        templates_version: Optional[str] = None,
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Send prompt to Gemini and analyze what apps are needed.
+        
+        Identical prompts (ignoring case/whitespace/trailing punctuation) against the
+        same template set are answered from a short TTL cache, and concurrent
+        duplicates share a single Gemini call.
+        
+        Args:
+            prompt: User's automation request
+            workflow_templates: List of available workflow templates from database
+            templates_version: Digest identifying the template set (computed if omitted)
+            use_cache: Set to False to skip the result cache lookup
             
-            logger.info(f"Sending prompt to Gemini (length: {len(prompt)} chars)")
-            
-            response = self.model.generate_content(
-                system_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,
-                )
+        Returns:
+            Dictionary containing either workflow_id (for existing templates) or workflow_json (for custom workflows)
+        """
+        if templates_version is None:
+            templates_version = _digest(
+                orjson.dumps(workflow_templates or [], option=orjson.OPT_SORT_KEYS, default=str)
             )
+        key = f"prompt:{_digest(_normalize_prompt(prompt).encode())}:{templates_version}"
+        
+        return await self._cached_analysis(
+            key,
+            use_cache,
+            lambda: self._analyze_prompt_uncached(prompt, workflow_templates, templates_version),
+            # Errors come back as a normal dict; only keep real analyses
+            lambda result: result.get("match_type") != "error"
+        )
+    
+    async def _cached_analysis(
+        self,
+        key: str,
+        use_cache: bool,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        cacheable: Callable[[Dict[str, Any]], bool]
+    ) -> Dict[str, Any]:
+        """
+        Serve an analysis from the TTL cache, join an identical in-flight call,
+        or run compute() and cache its result when cacheable(result) holds.
+        """
+        if use_cache:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                logger.info("Using cached Gemini analysis")
+                return dict(cached)
+        
+        pending = self._inflight.get(key)
+        if pending is not None:
+            logger.info("Joining in-flight Gemini analysis for identical request")
+            try:
+                return dict(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                # The leading request was cancelled, not this one: run the analysis here instead
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                return await self._cached_analysis(key, use_cache, compute, cacheable)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+        except Exception as exc:
+            # Followers get the same error; mark it retrieved in case there are none
+            future.set_exception(exc)
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        
+        future.set_result(result)
+        if cacheable(result):
+            self._result_cache[key] = result
+        # Callers get their own copy, as on cache hits, so the cached value stays intact
+        return dict(result)
+    
+    def clear_cache(self) -> int:
+        """Drop cached analyses and return how many were removed"""
+        cleared = len(self._result_cache)
+        self._result_cache.clear()
+        return cleared
+    
+    async def _analyze_prompt_uncached(
+        self,
+        prompt: str,
+        workflow_templates: Optional[List[Dict[str, Any]]],
+        templates_version: str
+    ) -> Dict[str, Any]:
+        """Run the Gemini template-matching call for analyze_prompt"""
+        try:
+            system_prompt = "".join((
+                _TEMPLATE_PROMPT_HEAD,
+                _render_templates_section(workflow_templates, templates_version),
+                _TEMPLATE_PROMPT_BODY,
+                prompt
+            ))
+            
+            response_text = await self._generate_json_text(system_prompt)
+            
+            logger.info("Raw Gemini response: %.500s", response_text)
+            
+            parsed_response = self._extract_and_parse_json(response_text)
+            
+            parsed_response = self._validate_workflow_response(parsed_response)
+            
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Gemini analysis complete: %.500s", orjson.dumps(parsed_response).decode())
+            return parsed_response
+            
+        except Exception as e:
+            logger.error("Error calling Gemini API: %s", e, exc_info=True)
+            return {
+                "match_type": "error",
+                "required_apps": [],
+                "error": str(e),
+                "reasoning": "Error occurred during analysis"
+            }
+    
+    async def analyze_prompt_with_functions(
+        self, 
+        prompt: str,
+        available_functions: Dict[str, Dict[str, Any]],
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Analyze user prompt and return function calls to execute.
+        This is the PRIMARY method for workflow execution - it generates the complete execution plan.
+        
+        Plans are cached per exact prompt and connected-app set, so repeated
+        requests skip Gemini. The prompt is not normalized here: plans carry
+        parameter values (subjects, bodies, recipients) copied verbatim from it.
+        
+        Args:
+            prompt: User's automation request
+            available_functions: Dict of available functions for user's connected apps
+            use_cache: Set to False to skip the result cache lookup
+            
+        Returns:
+            Dictionary containing:
+            - workflow_type: "simple" or "complex"
+            - function_calls: List of FunctionCall steps to execute in sequence
+            - required_apps: List of apps needed for this workflow
+            - reasoning: Explanation of the workflow logic
+        """
+        apps_signature = ",".join(sorted(available_functions or {}))
+        key = f"plan:{_digest((prompt or '').encode())}:{apps_signature}"
+        
+        return await self._cached_analysis(
+            key,
+            use_cache,
+            lambda: self._analyze_prompt_with_functions_uncached(prompt, available_functions),
+            # Only keep plans that validated into at least one function call
+            lambda result: result.get("workflow_type") != "error" and bool(result.get("function_calls"))
+        )
+    
+    async def _analyze_prompt_with_functions_uncached(
+        self,
+        prompt: str,
+        available_functions: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Run the Gemini function-planning call for analyze_prompt_with_functions"""
+        try:
+            if not prompt or prompt.strip() == "":
+                logger.error("Empty prompt provided to analyze_prompt_with_functions")
+                return {
+                    "workflow_type": "error",
+                    "function_calls": [],
+                    "required_apps": [],
+                    "reasoning": "No prompt provided. Please describe what you want to automate."
+                }
+            
+            if not available_functions:
+                # Nothing Gemini could plan against; skip the round-trip
+                logger.warning("No available functions provided - user may not have connected apps")
+                return {
+                    "workflow_type": "error",
+                    "function_calls": [],
+                    "required_apps": [],
+                    "reasoning": "User has no connected apps. Workflow cannot be executed."
+                }
             
-            response_text = response.text.strip()
-            logger.info(f"Raw Gemini response (first 500 chars): {response_text[:500]}")
+            system_prompt = _build_function_prompt(prompt, available_functions)
+            
+            logger.info("Sending prompt to Gemini (length: %d chars)", len(prompt))
+            
+            response_text = await self._generate_json_text(system_prompt)
+            logger.info("Raw Gemini response (first 500 chars): %.500s", response_text)
             
             parsed_response = self._extract_and_parse_json(response_text)
             
             parsed_response = self._validate_function_call_response(parsed_response)
             
-            logger.info(f"Gemini function call analysis complete: {len(parsed_response.get('function_calls', []))} steps generated")
+            logger.info("Gemini function call analysis complete: %d steps generated", len(parsed_response.get('function_calls', [])))
             return parsed_response
             
         except Exception as e:
-            logger.error(f"Error calling Gemini API: {str(e)}", exc_info=True)
+            logger.error("Error calling Gemini API: %s", e, exc_info=True)
             return {
                 "workflow_type": "error",
                 "function_calls": [],
@@ -263,6 +565,40 @@ Analyze the above user request and generate the appropriate function calls. Resp
                 "reasoning": f"Error occurred during analysis: {str(e)}"
             }
 
+    async def _generate_json_text(self, system_prompt: str) -> str:
+        """
+        Stream a Gemini completion and stop reading as soon as the first JSON
+        object in it is complete, skipping any trailing commentary.
+        """
+        async with self._gemini_semaphore:
+            response = await self.model.generate_content_async(
+                system_prompt,
+                generation_config=genai.types.GenerationConfig(
+                    temperature=0.3,
+                    # JSON mode: no fences or prose, so the orjson fast path parses it directly
+                    response_mime_type="application/json",
+                ),
+                stream=True
+            )
+            
+            buffer = ""
+            scanner = _JsonObjectScanner()
+            chunks = response.__aiter__()
+            try:
+                async for chunk in chunks:
+                    try:
+                        buffer += chunk.text
+                    except ValueError:
+                        # Chunk without text parts (e.g. finish/safety metadata only)
+                        continue
+                    if scanner.feed(buffer) != -1:
+                        break
+            finally:
+                await chunks.aclose()
+                await _close_stream(response)
+        
+        return buffer.strip()
+
     def _validate_function_call_response(self, response: Dict[str, Any]) -> Dict[str, Any]:
         """
         Validate and ensure response has all required fields for function call execution.
@@ -271,66 +607,69 @@ Analyze the above user request and generate the appropriate function calls. Resp
         validated = {
             "workflow_type": response.get("workflow_type", "simple"),
             "function_calls": response.get("function_calls", []),
-            "required_apps": response.get("required_apps", []),
+            "required_apps": [],
             "reasoning": response.get("reasoning", "Workflow execution plan")
         }
+        # dict as an insertion-ordered set: O(1) membership, stable output order
+        required_apps = dict.fromkeys(response.get("required_apps") or [])
         
         if not validated["function_calls"]:
             logger.warning("No function calls in response")
             validated["reasoning"] = "No function calls generated. " + validated["reasoning"]
         
+        function_calls = []
         for i, call in enumerate(validated["function_calls"]):
-            # Ensure step number
-            if "step" not in call:
-                call["step"] = i + 1
-            
             # Validate required fields
             if "app" not in call or "function" not in call:
-                logger.error(f"Function call {i+1} missing required 'app' or 'function' field: {call}")
-                call["app"] = call.get("app", "unknown")
-                call["function"] = call.get("function", "unknown")
+                logger.error("Function call %d missing required 'app' or 'function' field: %s", i + 1, call)
+            app_name = call.get("app", "unknown")
+            function_name = call.get("function", "unknown")
+            # Interned so later comparisons against registry/credential keys are pointer checks
+            if isinstance(app_name, str):
+                app_name = sys.intern(app_name)
+            if isinstance(function_name, str):
+                function_name = sys.intern(function_name)
             
-            # Ensure parameters exist
-            if "parameters" not in call:
-                call["parameters"] = {}
-            
-            # Add description if missing
-            if "description" not in call:
-                call["description"] = f"Execute {call.get('function', 'unknown')} on {call.get('app', 'unknown')}"
+            # Fill in step number, parameters and description when missing
+            function_calls.append(FunctionCall(
+                step=call.get("step", i + 1),
+                app=app_name,
+                function=function_name,
+                parameters=call.get("parameters", {}),
+                description=call.get("description") or f"Execute {function_name} on {app_name}",
+                store_result_as=call.get("store_result_as"),
+                use_results_from=call.get("use_results_from")
+            ))
             
             # Extract required app if not in list
-            app_name = call.get("app")
-            if app_name and app_name not in validated["required_apps"]:
-                validated["required_apps"].append(app_name)
+            if app_name:
+                required_apps[app_name] = None
         
+        validated["function_calls"] = function_calls
+        validated["required_apps"] = list(required_apps)
         return validated
 
     def _extract_and_parse_json(self, text: str) -> Dict[str, Any]:
         """
-        Extract and parse JSON from Gemini response with multiple strategies
+        Extract and parse JSON from Gemini response.
+        Plain JSON is parsed directly; otherwise the first balanced {...} is
+        located with a single brace-depth scan (ignoring fences and prose
+        around it) and parsed on its own.
         """
         try:
-            return json.loads(text)
-        except json.JSONDecodeError:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
             pass
         
-        try:
-            if "```json" in text:
-                json_text = text.split("```json")[1].split("```")[0].strip()
-                return json.loads(json_text)
-            elif "```" in text:
-                json_text = text.split("```")[1].split("```")[0].strip()
-                return json.loads(json_text)
-        except (json.JSONDecodeError, IndexError):
-            pass
-        
-        try:
-            json_match = re.search(r'\{[\s\S]*\}', text)
-            if json_match:
-                json_text = json_match.group(0)
-                return json.loads(json_text)
-        except json.JSONDecodeError:
-            pass
+        start = text.find("{")
+        while start != -1:
+            end = _json_object_end(text, start)
+            if end == -1:
+                break
+            try:
+                return orjson.loads(text[start:end])
+            except orjson.JSONDecodeError:
+                start = text.find("{", start + 1)
         
         logger.warning("All JSON parsing strategies failed")
         return {
@@ -341,50 +680,25 @@ Analyze the above user request and generate the appropriate function calls. Resp
             "reasoning": text[:500]
         }
     
-    def _validate_workflow_response(self, response: Dict[str, Any], original_prompt: str) -> Dict[str, Any]:
+    def _validate_workflow_response(self, response: Dict[str, Any]) -> Dict[str, Any]:
         """
         Validate and ensure response has all required fields based on match_type
         """
         match_type = response.get("match_type", "error")
-        
-        if match_type == "existing_template":
-            return {
-                "match_type": "existing_template",
-                "workflow_id": response.get("workflow_id"),
-                "required_apps": response.get("required_apps", []),
-                "confidence": response.get("confidence", 0.8),
-                "reasoning": response.get("reasoning", "Template matched")
-            }
-        elif match_type == "custom_workflow":
-            return {
-                "match_type": "custom_workflow",
-                "workflow_json": response.get("workflow_json", {}),
-                "required_apps": response.get("required_apps", []),
-                "reasoning": response.get("reasoning", "Custom workflow generated")
-            }
-        else:
+        if match_type not in _WORKFLOW_RESPONSE_DEFAULTS:
             # Fallback for old format or errors
-            return {
-                "match_type": "error",
-                "required_apps": response.get("required_apps", []),
-                "error": response.get("error", "Unknown response format"),
-                "reasoning": response.get("reasoning", "Could not determine workflow type")
-            }
+            match_type = "error"
+        
+        defaults = _WORKFLOW_RESPONSE_DEFAULTS[match_type]
+        validated = {**defaults, **{key: response[key] for key in defaults.keys() & response.keys()}}
+        validated["match_type"] = match_type
+        # Defaults that survived are shared containers; give each response its own
+        for key, value in validated.items():
+            if value is defaults[key] and isinstance(value, (list, dict)):
+                validated[key] = value.copy()
+        return validated
     
     def _extract_apps_from_text(self, text: str) -> List[str]:
         """Extract app names from text as fallback"""
-        common_apps = [
-            "Gmail", "Slack", "Google Sheets", "Google Drive", "Trello",
-            "Asana", "Notion", "Discord", "Twitter", "LinkedIn", "Salesforce",
-            "HubSpot", "Mailchimp", "Stripe", "PayPal", "Zoom", "Google Calendar",
-            "Dropbox", "GitHub", "Jira", "Airtable", "Zapier", "Monday.com"
-        ]
-        
-        found_apps = []
-        text_lower = text.lower()
-        
-        for app in common_apps:
-            if app.lower() in text_lower:
-                found_apps.append(app)
-        
-        return list(set(found_apps))
+        found = dict.fromkeys(_COMMON_APPS[match.group()] for match in _COMMON_APPS_RE.finditer(text.lower()))
+        return list(found)
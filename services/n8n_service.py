@@ -1,18 +1,140 @@
 import os
+import asyncio
+import hashlib
 import logging
+import random
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, Any, Optional
 import httpx
+import orjson
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=4096)
+def _stable_id(text: str) -> str:
+    """Process-independent short digest (built-in hash() is salted per process)"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=6).hexdigest()
+
+
+# Map app_type to n8n credential type (read-only, shared by every call)
+_CREDENTIAL_TYPE_MAP = MappingProxyType({
+    "gmail": "gmailOAuth2",
+    "slack": "slackOAuth2",
+    "google_sheets": "googleSheetsOAuth2",
+    "google_drive": "googleDriveOAuth2",
+    "trello": "trelloOAuth2",
+    "notion": "notionOAuth2",
+    # Add more mappings as needed
+})
+
+
+def _credential_payload(app_type: str, credentials: Dict[str, Any], credential_name: str) -> Optional[Dict[str, Any]]:
+    """Build the n8n credential body for an app, or None if the app has no n8n credential type"""
+    n8n_credential_type = _CREDENTIAL_TYPE_MAP.get(app_type)
+    if not n8n_credential_type:
+        logger.warning(f"No n8n credential type mapping for {app_type}")
+        return None
+    
+    return {
+        "name": credential_name,
+        "type": n8n_credential_type,
+        "data": {
+            "oauthTokenData": {
+                "access_token": credentials.get("access_token"),
+                "refresh_token": credentials.get("refresh_token"),
+                "token_type": credentials.get("token_type", "Bearer"),
+                "expires_in": credentials.get("expiry_date"),
+                "scope": credentials.get("scope")
+            }
+        }
+    }
+
+
+# Transient gateway errors worth retrying on idempotent GETs, and the retry budget
+_RETRY_STATUS_CODES = frozenset((502, 503, 504))
+_RETRY_ATTEMPTS = 3
+
+
+# Request bodies are pre-encoded with orjson and sent as content=, so the type is set explicitly
+_JSON_HEADERS = MappingProxyType({"Content-Type": "application/json"})
+
+
+# Cap on how much of an error response body is read off the wire (see N8nService._send)
+_ERROR_BODY_LIMIT = 2048
+
+
+def _error_body(response: httpx.Response) -> str:
+    """Decode an error response body (already capped at _ERROR_BODY_LIMIT bytes by _send)"""
+    return response.content[:_ERROR_BODY_LIMIT].decode("utf-8", errors="replace")
+
+
+def _http_error_fields(response: httpx.Response) -> Dict[str, Any]:
+    """Structured log fields for a failed n8n call, passed as logging extra="""
+    return {"n8n_url": str(response.request.url), "n8n_status": response.status_code}
+
+
 class N8nService:
     """Service for interacting with n8n workflows via webhooks"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.base_url = os.getenv("N8N_BASE_URL", "http://localhost:5678")
+        # Long-lived client so calls reuse pooled keep-alive connections to n8n
+        self._owns_client = http_client is None
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=128),
+            timeout=httpx.Timeout(30.0)
+        )
         logger.info("N8nService initialized for webhook-based workflow triggering")
     
+    async def aclose(self):
+        """Close the HTTP client if this service created it (a shared client is closed by its owner)"""
+        if self._owns_client:
+            await self.http_client.aclose()
+    
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request, reading success bodies in full but only the first
+        _ERROR_BODY_LIMIT bytes of error bodies (n8n error pages can be large);
+        the rest of an error body is never downloaded or buffered.
+        """
+        request = self.http_client.build_request(method, url, **kwargs)
+        response = await self.http_client.send(request, stream=True)
+        try:
+            if response.is_success:
+                await response.aread()
+                return response
+            
+            head = bytearray()
+            async for chunk in response.aiter_bytes():
+                head += chunk
+                if len(head) >= _ERROR_BODY_LIMIT:
+                    break
+        finally:
+            await response.aclose()
+        # Headers are dropped: they describe the full (possibly encoded) body, not this prefix
+        return httpx.Response(response.status_code, content=bytes(head[:_ERROR_BODY_LIMIT]), request=request)
+    
+    async def _get_with_retry(self, url: str, **kwargs) -> httpx.Response:
+        """
+        GET with up to _RETRY_ATTEMPTS tries on transport errors and 502/503/504,
+        backing off exponentially with jitter (0.1s, 0.2s, ... capped at 2s).
+        Only used for idempotent reads; the last response or error is returned/raised.
+        """
+        for attempt in range(_RETRY_ATTEMPTS):
+            last_attempt = attempt == _RETRY_ATTEMPTS - 1
+            try:
+                response = await self._send("GET", url, **kwargs)
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+            else:
+                if last_attempt or response.status_code not in _RETRY_STATUS_CODES:
+                    return response
+            delay = min(0.1 * 2 ** attempt, 2.0)
+            await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+    
     async def trigger_workflow_webhook(
         self,
         webhook_url: str,
@@ -36,35 +158,43 @@ class N8nService:
                 **parameters
             }
             
-            logger.info(f"Triggering workflow webhook: {webhook_url}")
-            logger.info(f"Webhook payload: {payload}")
+            logger.info("Triggering workflow webhook: %s", webhook_url)
+            logger.info("Webhook payload: %s", payload)
+            
+            response = await self._send(
+                "POST",
+                webhook_url,
+                content=orjson.dumps(payload),
+                timeout=60.0,
+                headers=_JSON_HEADERS
+            )
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    webhook_url,
-                    json=payload,
-                    timeout=60.0,
-                    headers={"Content-Type": "application/json"}
+            logger.info("Webhook response status: %s", response.status_code)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Webhook response body: %.500s", response.text)
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content) if response.headers.get("content-type", "").startswith("application/json") else {"raw": response.text}
+                logger.info(f"Workflow webhook triggered successfully")
+                execution_id = result.get("executionId")
+                if execution_id is None:
+                    execution_id = f"webhook_{user_id}_{_stable_id(webhook_url)}"
+                return {
+                    "success": True,
+                    "execution_id": execution_id,
+                    "data": result
+                }
+            else:
+                error_body = _error_body(response)
+                logger.error(
+                    "Failed to trigger workflow webhook: %s - %s", response.status_code, error_body,
+                    extra=_http_error_fields(response)
                 )
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}: {error_body}"
+                }
                 
-                logger.info(f"Webhook response status: {response.status_code}")
-                logger.info(f"Webhook response body: {response.text[:500]}")
-                
-                if response.status_code == 200:
-                    result = response.json() if response.headers.get("content-type", "").startswith("application/json") else {"raw": response.text}
-                    logger.info(f"Workflow webhook triggered successfully")
-                    return {
-                        "success": True,
-                        "execution_id": result.get("executionId", f"webhook_{user_id}_{hash(webhook_url)}"),
-                        "data": result
-                    }
-                else:
-                    logger.error(f"Failed to trigger workflow webhook: {response.status_code} - {response.text}")
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}: {response.text}"
-                    }
-                    
         except Exception as e:
             logger.error(f"Error triggering n8n workflow webhook: {str(e)}", exc_info=True)
             return {
@@ -99,28 +229,29 @@ class N8nService:
                 "parameters": parameters
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    timeout=30.0
-                )
+            response = await self._send(
+                "POST",
+                url,
+                content=orjson.dumps(payload),
+                headers=_JSON_HEADERS,
+                timeout=30.0
+            )
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                logger.info(f"Workflow triggered successfully: {workflow_id}")
+                return {
+                    "success": True,
+                    "execution_id": result.get("data", {}).get("executionId"),
+                    "data": result
+                }
+            else:
+                logger.error("Failed to trigger workflow: %s", response.status_code, extra=_http_error_fields(response))
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}: {_error_body(response)}"
+                }
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"Workflow triggered successfully: {workflow_id}")
-                    return {
-                        "success": True,
-                        "execution_id": result.get("data", {}).get("executionId"),
-                        "data": result
-                    }
-                else:
-                    logger.error(f"Failed to trigger workflow: {response.status_code}")
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}: {response.text}"
-                    }
-                    
         except Exception as e:
             logger.error(f"Error triggering n8n workflow: {str(e)}")
             return {
@@ -141,26 +272,25 @@ class N8nService:
         try:
             url = f"{self.base_url}/api/v1/executions/{execution_id}"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    url,
-                    timeout=10.0
-                )
+            response = await self._get_with_retry(
+                url,
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                return {
+                    "success": True,
+                    "status": result.get("data", {}).get("status"),
+                    "data": result
+                }
+            else:
+                logger.error("Failed to get execution status: %s", response.status_code, extra=_http_error_fields(response))
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}: {_error_body(response)}"
+                }
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    return {
-                        "success": True,
-                        "status": result.get("data", {}).get("status"),
-                        "data": result
-                    }
-                else:
-                    logger.error(f"Failed to get execution status: {response.status_code}")
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}: {response.text}"
-                    }
-                    
         except Exception as e:
             logger.error(f"Error getting execution status: {str(e)}")
             return {
@@ -181,18 +311,17 @@ class N8nService:
         try:
             url = f"{self.base_url}/api/v1/workflows/{workflow_id}"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    url,
-                    timeout=10.0
-                )
+            response = await self._get_with_retry(
+                url,
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                return orjson.loads(response.content)
+            else:
+                logger.error("Failed to get workflow details: %s", response.status_code, extra=_http_error_fields(response))
+                return None
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Failed to get workflow details: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Error getting workflow details: {str(e)}")
             return None
@@ -217,86 +346,75 @@ class N8nService:
             n8n credential ID or None
         """
         try:
-            # Map app_type to n8n credential type
-            credential_type_map = {
-                "gmail": "gmailOAuth2",
-                "slack": "slackOAuth2",
-                "google_sheets": "googleSheetsOAuth2",
-                "google_drive": "googleDriveOAuth2",
-                "trello": "trelloOAuth2",
-                "notion": "notionOAuth2",
-                # Add more mappings as needed
-            }
-            
-            n8n_credential_type = credential_type_map.get(app_type)
-            if not n8n_credential_type:
-                logger.warning(f"No n8n credential type mapping for {app_type}")
+            credential_data = _credential_payload(app_type, credentials, credential_name)
+            if credential_data is None:
                 return None
             
-            # Prepare credential data for n8n
-            credential_data = {
-                "name": credential_name,
-                "type": n8n_credential_type,
-                "data": {
-                    "oauthTokenData": {
-                        "access_token": credentials.get("access_token"),
-                        "refresh_token": credentials.get("refresh_token"),
-                        "token_type": credentials.get("token_type", "Bearer"),
-                        "expires_in": credentials.get("expiry_date"),
-                        "scope": credentials.get("scope")
-                    }
-                }
-            }
-            
-            # Check if credential already exists
-            url = f"{self.base_url}/api/v1/credentials"
-            
-            async with httpx.AsyncClient() as client:
-                # Try to find existing credential
-                get_response = await client.get(
-                    url,
-                    params={"filter": f'{{"name": "{credential_name}"}}'},
-                    timeout=10.0
-                )
-                
-                if get_response.status_code == 200:
-                    existing_creds = get_response.json().get("data", [])
-                    
-                    if existing_creds:
-                        # Update existing credential
-                        credential_id = existing_creds[0]["id"]
-                        update_url = f"{url}/{credential_id}"
-                        
-                        update_response = await client.patch(
-                            update_url,
-                            json=credential_data,
-                            timeout=10.0
-                        )
-                        
-                        if update_response.status_code == 200:
-                            logger.info(f"Updated n8n credential: {credential_id}")
-                            return credential_id
-                    else:
-                        # Create new credential
-                        create_response = await client.post(
-                            url,
-                            json=credential_data,
-                            timeout=10.0
-                        )
-                        
-                        if create_response.status_code == 201:
-                            result = create_response.json()
-                            credential_id = result.get("data", {}).get("id")
-                            logger.info(f"Created n8n credential: {credential_id}")
-                            return credential_id
-                
+            # Try to find existing credential
+            existing_ids = await self._find_credential_ids({"name": credential_name})
+            if existing_ids is None:
                 logger.error(f"Failed to create/update n8n credential")
                 return None
-                
+            
+            return await self._upsert_credential(credential_data, existing_ids.get(credential_name))
+            
         except Exception as e:
             logger.error(f"Error creating n8n credential: {str(e)}")
             return None
     
+    async def _find_credential_ids(self, name_filter: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """Map existing n8n credential names matching name_filter to IDs, or None if the lookup failed"""
+        response = await self._send(
+            "GET",
+            f"{self.base_url}/api/v1/credentials",
+            params={"filter": orjson.dumps(name_filter).decode()},
+            timeout=10.0
+        )
+        if response.status_code != 200:
+            return None
+        
+        ids: Dict[str, str] = {}
+        for credential in orjson.loads(response.content).get("data", []):
+            # Keep the first match per name, as the single-name lookup always did
+            ids.setdefault(credential.get("name"), credential["id"])
+        return ids
+    
+    async def _upsert_credential(self, credential_data: Dict[str, Any], credential_id: Optional[str]) -> Optional[str]:
+        """PATCH an existing n8n credential or POST a new one; returns its ID"""
+        url = f"{self.base_url}/api/v1/credentials"
+        
+        if credential_id:
+            # Update existing credential
+            update_response = await self._send(
+                "PATCH",
+                f"{url}/{credential_id}",
+                content=orjson.dumps(credential_data),
+                headers=_JSON_HEADERS,
+                timeout=10.0
+            )
+            
+            if update_response.status_code == 200:
+                logger.info(f"Updated n8n credential: {credential_id}")
+                return credential_id
+        else:
+            # Create new credential
+            create_response = await self._send(
+                "POST",
+                url,
+                content=orjson.dumps(credential_data),
+                headers=_JSON_HEADERS,
+                timeout=10.0
+            )
+            
+            if create_response.status_code == 201:
+                result = orjson.loads(create_response.content)
+                credential_id = result.get("data", {}).get("id")
+                logger.info(f"Created n8n credential: {credential_id}")
+                return credential_id
+        
+        logger.error(f"Failed to create/update n8n credential")
+        return None
+    
     async def trigger_workflow_with_credentials(
         self,
         workflow_id: str,
@@ -327,28 +445,29 @@ class N8nService:
                 "user_credentials": user_credentials  # Pass credentials to workflow
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    timeout=30.0
-                )
+            response = await self._send(
+                "POST",
+                url,
+                content=orjson.dumps(payload),
+                headers=_JSON_HEADERS,
+                timeout=30.0
+            )
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                logger.info(f"Workflow triggered successfully with user credentials: {workflow_id}")
+                return {
+                    "success": True,
+                    "execution_id": result.get("data", {}).get("executionId"),
+                    "data": result
+                }
+            else:
+                logger.error("Failed to trigger workflow: %s", response.status_code, extra=_http_error_fields(response))
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}: {_error_body(response)}"
+                }
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"Workflow triggered successfully with user credentials: {workflow_id}")
-                    return {
-                        "success": True,
-                        "execution_id": result.get("data", {}).get("executionId"),
-                        "data": result
-                    }
-                else:
-                    logger.error(f"Failed to trigger workflow: {response.status_code}")
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}: {response.text}"
-                    }
-                    
         except Exception as e:
             logger.error(f"Error triggering n8n workflow: {str(e)}")
             return {
@@ -1,27 +1,211 @@
+import asyncio
 import logging
+import re
+import time
 import httpx
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+import orjson
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple
+from cachetools import TTLCache
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from services.supabase_service import SupabaseService
 from helpers import GmailHelpers, GCalendarHelpers, NotionHelpers, SlackHelpers, DiscordHelpers
 import os
 
 logger = logging.getLogger(__name__)
 
+# Tokens are refreshed this many seconds before they actually expire
+_EXPIRY_BUFFER_SECONDS = 5 * 60
+
+# /proxy action names used by n8n nodes -> (helper function name, key of the list in the
+# helper result that can be streamed as NDJSON, or None), per normalized app
+_PROXY_ACTIONS = {
+    "gmail": {"fetchEmails": ("list_messages", "messages"), "sendEmail": ("send_message", None)},
+    "calendar": {"listEvents": ("list_events", "events"), "createEvent": ("create_event", None)},
+    "slack": {"postMessage": ("send_message", None), "listChannels": ("list_channels", "channels")},
+    "notion": {"createPage": ("create_page", None), "queryDatabase": ("query_database", "results")},
+    "discord": {"sendMessage": ("send_message", None), "getChannel": ("get_channel", None)},
+}
+# Helper results whose error text means the provider rejected the token (HTTP 401,
+# Slack invalid_auth/token_revoked/token_expired, Notion unauthorized, ...)
+_AUTH_FAILURE_RE = re.compile(r"\b401\b|unauthori[sz]ed|invalid_auth|not_authed|token_revoked|token_expired|invalid_grant", re.IGNORECASE)
+
+# Helper function names are accepted as actions too
+for _actions in _PROXY_ACTIONS.values():
+    _actions.update({function_name: (function_name, stream_key) for function_name, stream_key in list(_actions.values())})
+
+
+@dataclass(slots=True)
+class NormalizedCredentials:
+    """Stored app credentials flattened once: token and expiry (epoch seconds) pulled out of the nested record"""
+    access_token: Optional[str]
+    expires_at_epoch: Optional[float]
+    raw: Dict[str, Any]
+    
+    def is_expired(self) -> bool:
+        """True if the token expires within the refresh buffer (unknown expiry counts as valid)"""
+        if self.expires_at_epoch is None:
+            return False
+        return time.time() >= self.expires_at_epoch - _EXPIRY_BUFFER_SECONDS
+
+
+def _normalize_credentials(credentials: Dict[str, Any]) -> NormalizedCredentials:
+    """Locate the access token and parse the expiry of a stored credential record"""
+    access_token = None
+    if "access_token" in credentials:
+        access_token = credentials["access_token"]
+    elif isinstance(credentials.get("credentials"), dict) and "access_token" in credentials["credentials"]:
+        access_token = credentials["credentials"]["access_token"]
+    elif isinstance(credentials.get("data"), dict) and "access_token" in credentials["data"]:
+        access_token = credentials["data"]["access_token"]
+    
+    expires_at = None
+    if "expiry_date" in credentials:
+        expires_at = credentials["expiry_date"]
+    elif isinstance(credentials.get("credentials"), dict):
+        expires_at = credentials["credentials"].get("expiry_date")
+    elif isinstance(credentials.get("metadata"), dict):
+        expires_at = credentials["metadata"].get("expiry_date")
+    
+    if not expires_at:
+        logger.warning("No expiration info found in credentials, assuming token is valid")
+        return NormalizedCredentials(access_token, None, credentials)
+    
+    try:
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        if isinstance(expires_at, datetime):
+            # Naive timestamps are stored in UTC
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            expires_at_epoch = expires_at.timestamp()
+        else:
+            expires_at_epoch = float(expires_at)
+            # Google returns expiry_date in milliseconds
+            if expires_at_epoch > 1e11:
+                expires_at_epoch /= 1000
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Error checking token expiration: {str(e)}")
+        # Unparseable expiry: treat as expired so the token gets refreshed
+        expires_at_epoch = 0.0
+    
+    return NormalizedCredentials(access_token, expires_at_epoch, credentials)
+
+
 class ProxyService:
     """
     Service to handle proxy requests to third-party APIs using user-specific OAuth tokens.
     Now uses helper functions with official SDKs instead of raw API calls.
     """
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.supabase_service = SupabaseService()
         self.timeout = httpx.Timeout(30.0, connect=10.0)
+        # Long-lived client so token refreshes reuse pooled keep-alive connections
+        self.http_client = http_client or httpx.AsyncClient(timeout=self.timeout)
+        # Per-(user, app) credentials, so repeated calls skip the Supabase lookup;
+        # concurrent misses for the same key share a single fetch
+        self._credentials_cache: TTLCache = TTLCache(maxsize=10_000, ttl=int(os.getenv("PROXY_CREDENTIALS_TTL", "300")))
+        self._credentials_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
         self.gmail_helpers = GmailHelpers()
         self.gcalendar_helpers = GCalendarHelpers()
         self.notion_helpers = NotionHelpers()
         self.slack_helpers = SlackHelpers()
         self.discord_helpers = DiscordHelpers()
+        
+        # Dispatch tables: normalized app name -> (display name, function name -> helper)
+        gcalendar_functions = {
+            "list_events": self.gcalendar_helpers.list_events,
+            "create_event": self.gcalendar_helpers.create_event,
+            "get_event": self.gcalendar_helpers.get_event,
+            "update_event": self.gcalendar_helpers.update_event,
+            "delete_event": self.gcalendar_helpers.delete_event,
+        }
+        self._app_functions = {
+            "gmail": ("Gmail", {
+                "list_messages": self.gmail_helpers.list_messages,
+                "get_message": self.gmail_helpers.get_message,
+                "get_messages": self.gmail_helpers.get_messages,
+                "send_message": self.gmail_helpers.send_message,
+                "delete_message": self.gmail_helpers.delete_message,
+                "modify_message": self.gmail_helpers.modify_message,
+                "create_draft": self.gmail_helpers.create_draft,
+            }),
+            "calendar": ("Google Calendar", gcalendar_functions),
+            "gcalendar": ("Google Calendar", gcalendar_functions),
+            "notion": ("Notion", {
+                "create_page": self.notion_helpers.create_page,
+                "get_page": self.notion_helpers.get_page,
+                "update_page": self.notion_helpers.update_page,
+                "query_database": self.notion_helpers.query_database,
+            }),
+            "slack": ("Slack", {
+                "send_message": self.slack_helpers.send_message,
+                "list_channels": self.slack_helpers.list_channels,
+            }),
+            "discord": ("Discord", {
+                "send_message": self.discord_helpers.send_message,
+                "get_channel": self.discord_helpers.get_channel,
+            }),
+        }
+    
+    async def _get_credentials(self, user_id: str, app_name: str) -> Optional[NormalizedCredentials]:
+        """Fetch a user's credentials for a (normalized) app through the TTL cache"""
+        key = (user_id, app_name)
+        credentials = self._credentials_cache.get(key)
+        if credentials is not None:
+            return credentials
+        
+        pending = self._credentials_inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch_credentials(key))
+            self._credentials_inflight[key] = pending
+            
+            def _clear_inflight(done: asyncio.Future) -> None:
+                # Leave a newer fetch alone if this one was invalidated and replaced
+                if self._credentials_inflight.get(key) is done:
+                    del self._credentials_inflight[key]
+            
+            pending.add_done_callback(_clear_inflight)
+        
+        # Shielded so one cancelled caller doesn't cancel the fetch for the others
+        return await asyncio.shield(pending)
+    
+    async def _fetch_credentials(self, key: Tuple[str, str]) -> Optional[NormalizedCredentials]:
+        """Load and normalize credentials from Supabase, caching them unless invalidated meanwhile"""
+        user_id, app_name = key
+        raw_credentials = await self.supabase_service.get_user_app_credentials(
+            user_id=user_id,
+            app_name=app_name
+        )
+        if not raw_credentials:
+            return None
+        credentials = _normalize_credentials(raw_credentials)
+        # invalidate_credentials() drops the in-flight entry; a row read before that may be stale
+        if self._credentials_inflight.get(key) is asyncio.current_task():
+            self._credentials_cache[key] = credentials
+        return credentials
+    
+    def invalidate_credentials(self, user_id: str, app_name: str) -> None:
+        """
+        Drop cached credentials, e.g. after the user reconnects the app or the provider
+        rejects the token. This only affects the current worker process; other workers
+        keep their copy until PROXY_CREDENTIALS_TTL expires or they hit an auth failure.
+        """
+        key = (user_id, self._normalize_app_name(app_name))
+        self._credentials_cache.pop(key, None)
+        self._credentials_inflight.pop(key, None)
+    
+    def _evict_on_auth_failure(self, user_id: str, app_name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Invalidate cached credentials when a helper reports the provider rejected the token"""
+        if not result.get("success") and _AUTH_FAILURE_RE.search(str(result.get("error", ""))):
+            logger.info("Auth failure from %s; evicting cached credentials", app_name)
+            self.invalidate_credentials(user_id, app_name)
+        return result
+    
+    async def aclose(self):
+        """Release pooled connections held by the helpers (the shared http_client is closed by its owner)"""
+        await DiscordHelpers.aclose()
     
     async def execute_function_call(
         self,
@@ -43,15 +227,17 @@ class ProxyService:
             Dict with function execution result
         """
         try:
-            logger.info(f"Executing {app_name}.{function_name} for user: {user_id}")
+            logger.info("Executing %s.%s for user: %s", app_name, function_name, user_id)
             
             normalized_app_name = self._normalize_app_name(app_name)
-            logger.info(f"Normalized app name from '{app_name}' to '{normalized_app_name}'")
+            logger.debug("Normalized app name from '%s' to '%s'", app_name, normalized_app_name)
             
-            credentials = await self.supabase_service.get_user_app_credentials(
-                user_id=user_id,
-                app_name=normalized_app_name
-            )
+            # Reject unknown app/function pairs before spending a Supabase round-trip
+            label, handler, error = self._resolve_handler(app_name, normalized_app_name, function_name)
+            if error:
+                return error
+            
+            credentials = await self._get_credentials(user_id, normalized_app_name)
             
             if not credentials:
                 return {
@@ -59,9 +245,9 @@ class ProxyService:
                     "error": f"No credentials found for {app_name}. Please connect your account first."
                 }
             
-            if self._is_token_expired(credentials):
+            if credentials.is_expired():
                 logger.info(f"Token expired, refreshing for {app_name}")
-                refresh_result = await self._refresh_access_token(user_id, normalized_app_name, credentials)
+                refresh_result = await self._refresh_access_token(user_id, normalized_app_name, credentials.raw)
                 
                 if not refresh_result["success"]:
                     return {
@@ -69,9 +255,9 @@ class ProxyService:
                         "error": refresh_result.get("error", "Failed to refresh token")
                     }
                 
-                credentials = refresh_result["credentials"]
+                credentials = refresh_result["normalized"]
             
-            access_token = self._extract_access_token(credentials)
+            access_token = credentials.access_token
             
             if not access_token:
                 return {
@@ -79,21 +265,9 @@ class ProxyService:
                     "error": f"Invalid credentials for {app_name}"
                 }
             
-            if normalized_app_name == "gmail":
-                return await self._execute_gmail_function(access_token, function_name, parameters)
-            elif normalized_app_name in ["calendar", "gcalendar"]:
-                return await self._execute_gcalendar_function(access_token, function_name, parameters)
-            elif normalized_app_name == "notion":
-                return await self._execute_notion_function(access_token, function_name, parameters)
-            elif normalized_app_name == "slack":
-                return await self._execute_slack_function(access_token, function_name, parameters)
-            elif normalized_app_name == "discord":
-                return await self._execute_discord_function(access_token, function_name, parameters)
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unsupported app: {app_name}"
-                }
+            return self._evict_on_auth_failure(
+                user_id, normalized_app_name, await self._dispatch(label, handler, access_token, parameters)
+            )
                 
         except Exception as e:
             logger.error(f"Error executing function call: {str(e)}")
@@ -125,21 +299,23 @@ class ProxyService:
             Dict with function execution result
         """
         try:
-            logger.info(f"Executing {app_name}.{function_name} for user: {user_id}")
+            logger.info("Executing %s.%s for user: %s", app_name, function_name, user_id)
             
             normalized_app_name = self._normalize_app_name(app_name)
-            logger.info(f"Normalized app name from '{app_name}' to '{normalized_app_name}'")
+            logger.debug("Normalized app name from '%s' to '%s'", app_name, normalized_app_name)
+            
+            # Reject unknown app/function pairs before spending a Supabase round-trip
+            label, handler, error = self._resolve_handler(app_name, normalized_app_name, function_name)
+            if error:
+                return error
             
             # Use cached credentials if available, otherwise fetch from DB
             if cached_credentials:
-                logger.info(f"Using cached credentials for {normalized_app_name}")
-                credentials = cached_credentials
+                logger.debug("Using cached credentials for %s", normalized_app_name)
+                credentials = _normalize_credentials(cached_credentials)
             else:
-                logger.info(f"Fetching credentials from DB for {normalized_app_name}")
-                credentials = await self.supabase_service.get_user_app_credentials(
-                    user_id=user_id,
-                    app_name=normalized_app_name
-                )
+                logger.debug("Fetching credentials from DB for %s", normalized_app_name)
+                credentials = await self._get_credentials(user_id, normalized_app_name)
             
             if not credentials:
                 return {
@@ -147,9 +323,9 @@ class ProxyService:
                     "error": f"No credentials found for {app_name}. Please connect your account first."
                 }
             
-            if self._is_token_expired(credentials):
+            if credentials.is_expired():
                 logger.info(f"Token expired, refreshing for {app_name}")
-                refresh_result = await self._refresh_access_token(user_id, normalized_app_name, credentials)
+                refresh_result = await self._refresh_access_token(user_id, normalized_app_name, credentials.raw)
                 
                 if not refresh_result["success"]:
                     return {
@@ -157,9 +333,9 @@ class ProxyService:
                         "error": refresh_result.get("error", "Failed to refresh token")
                     }
                 
-                credentials = refresh_result["credentials"]
+                credentials = refresh_result["normalized"]
             
-            access_token = self._extract_access_token(credentials)
+            access_token = credentials.access_token
             
             if not access_token:
                 return {
@@ -167,21 +343,9 @@ class ProxyService:
                     "error": f"Invalid credentials for {app_name}"
                 }
             
-            if normalized_app_name == "gmail":
-                return await self._execute_gmail_function(access_token, function_name, parameters)
-            elif normalized_app_name in ["calendar", "gcalendar"]:
-                return await self._execute_gcalendar_function(access_token, function_name, parameters)
-            elif normalized_app_name == "notion":
-                return await self._execute_notion_function(access_token, function_name, parameters)
-            elif normalized_app_name == "slack":
-                return await self._execute_slack_function(access_token, function_name, parameters)
-            elif normalized_app_name == "discord":
-                return await self._execute_discord_function(access_token, function_name, parameters)
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unsupported app: {app_name}"
-                }
+            return self._evict_on_auth_failure(
+                user_id, normalized_app_name, await self._dispatch(label, handler, access_token, parameters)
+            )
                 
         except Exception as e:
             logger.error(f"Error executing function call: {str(e)}", exc_info=True)
@@ -190,127 +354,79 @@ class ProxyService:
                 "error": str(e)
             }
     
-    async def _execute_gmail_function(
-        self,
-        access_token: str,
-        function_name: str,
-        parameters: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Execute Gmail helper function."""
-        try:
-            if function_name == "list_messages":
-                return await self.gmail_helpers.list_messages(access_token, **parameters)
-            elif function_name == "get_message":
-                return await self.gmail_helpers.get_message(access_token, **parameters)
-            elif function_name == "send_message":
-                return await self.gmail_helpers.send_message(access_token, **parameters)
-            elif function_name == "delete_message":
-                return await self.gmail_helpers.delete_message(access_token, **parameters)
-            elif function_name == "modify_message":
-                return await self.gmail_helpers.modify_message(access_token, **parameters)
-            elif function_name == "create_draft":
-                return await self.gmail_helpers.create_draft(access_token, **parameters)
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unknown Gmail function: {function_name}"
-                }
-        except Exception as e:
-            logger.error(f"Gmail function error: {str(e)}")
-            return {"success": False, "error": str(e)}
-    
-    async def _execute_gcalendar_function(
+    async def proxy_request(
         self,
-        access_token: str,
-        function_name: str,
-        parameters: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Execute Google Calendar helper function."""
-        try:
-            if function_name == "list_events":
-                return await self.gcalendar_helpers.list_events(access_token, **parameters)
-            elif function_name == "create_event":
-                return await self.gcalendar_helpers.create_event(access_token, **parameters)
-            elif function_name == "get_event":
-                return await self.gcalendar_helpers.get_event(access_token, **parameters)
-            elif function_name == "update_event":
-                return await self.gcalendar_helpers.update_event(access_token, **parameters)
-            elif function_name == "delete_event":
-                return await self.gcalendar_helpers.delete_event(access_token, **parameters)
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unknown Google Calendar function: {function_name}"
-                }
-        except Exception as e:
-            logger.error(f"Google Calendar function error: {str(e)}")
-            return {"success": False, "error": str(e)}
-    
-    async def _execute_notion_function(
-        self,
-        access_token: str,
-        function_name: str,
-        parameters: Dict[str, Any]
+        user_id: str,
+        app_name: str,
+        action: str,
+        payload: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """Execute Notion helper function."""
-        try:
-            if function_name == "create_page":
-                return await self.notion_helpers.create_page(access_token, **parameters)
-            elif function_name == "get_page":
-                return await self.notion_helpers.get_page(access_token, **parameters)
-            elif function_name == "update_page":
-                return await self.notion_helpers.update_page(access_token, **parameters)
-            elif function_name == "query_database":
-                return await self.notion_helpers.query_database(access_token, **parameters)
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unknown Notion function: {function_name}"
-                }
-        except Exception as e:
-            logger.error(f"Notion function error: {str(e)}")
-            return {"success": False, "error": str(e)}
+        """
+        Run a /proxy action for n8n workflows.
+        
+        Args:
+            user_id: User's unique identifier
+            app_name: Name of the app from the URL (gmail, slack, etc.)
+            action: n8n action name (e.g. fetchEmails) or helper function name
+            payload: Helper parameters
+            
+        Returns:
+            Dict with success, the helper's result (minus "success") under "data",
+            and "stream_key" naming the list in data that may be streamed, if any
+        """
+        actions = _PROXY_ACTIONS.get(self._normalize_app_name(app_name), {})
+        function_name, stream_key = actions.get(action, (action, None))
+        result = await self.execute_function_call(
+            user_id=user_id,
+            app_name=app_name,
+            function_name=function_name,
+            parameters=payload
+        )
+        if not result.get("success"):
+            return result
+        
+        return {
+            "success": True,
+            "data": {key: value for key, value in result.items() if key != "success"},
+            "stream_key": stream_key
+        }
     
-    async def _execute_slack_function(
+    def _resolve_handler(
         self,
-        access_token: str,
-        function_name: str,
-        parameters: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Execute Slack helper function."""
-        try:
-            if function_name == "send_message":
-                return await self.slack_helpers.send_message(access_token, **parameters)
-            elif function_name == "list_channels":
-                return await self.slack_helpers.list_channels(access_token, **parameters)
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unknown Slack function: {function_name}"
-                }
-        except Exception as e:
-            logger.error(f"Slack function error: {str(e)}")
-            return {"success": False, "error": str(e)}
+        app_name: str,
+        normalized_app_name: str,
+        function_name: str
+    ) -> Tuple[Optional[str], Optional[Callable[..., Awaitable[Dict[str, Any]]]], Optional[Dict[str, Any]]]:
+        """Look up the helper for an app/function pair; returns (label, handler, error)."""
+        entry = self._app_functions.get(normalized_app_name)
+        if entry is None:
+            return None, None, {
+                "success": False,
+                "error": f"Unsupported app: {app_name}"
+            }
+        
+        label, functions = entry
+        handler = functions.get(function_name)
+        if handler is None:
+            return label, None, {
+                "success": False,
+                "error": f"Unknown {label} function: {function_name}"
+            }
+        
+        return label, handler, None
     
-    async def _execute_discord_function(
+    async def _dispatch(
         self,
+        label: str,
+        handler: Callable[..., Awaitable[Dict[str, Any]]],
         access_token: str,
-        function_name: str,
         parameters: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """Execute Discord helper function."""
+        """Run a resolved helper, turning helper exceptions into error results."""
         try:
-            if function_name == "send_message":
-                return await self.discord_helpers.send_message(access_token, **parameters)
-            elif function_name == "get_channel":
-                return await self.discord_helpers.get_channel(access_token, **parameters)
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unknown Discord function: {function_name}"
-                }
+            return await handler(access_token, **parameters)
         except Exception as e:
-            logger.error(f"Discord function error: {str(e)}")
+            logger.error(f"{label} function error: {str(e)}")
             return {"success": False, "error": str(e)}
     
     async def _refresh_access_token(
@@ -374,52 +490,55 @@ class ProxyService:
                     "error": "OAuth configuration missing. Please reconnect your account."
                 }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                data = {
-                    "grant_type": "refresh_token",
-                    "refresh_token": refresh_token,
-                    "client_id": client_id,
-                    "client_secret": client_secret
-                }
-                
-                response = await client.post(token_endpoint, data=data)
-                response.raise_for_status()
-                
-                token_data = response.json()
-                
-                new_access_token = token_data.get("access_token")
-                new_refresh_token = token_data.get("refresh_token", refresh_token)
-                expires_in = token_data.get("expires_in", 3600)
-                
-                if not new_access_token:
-                    return {
-                        "success": False,
-                        "error": "Failed to obtain new access token"
-                    }
-                
-                expires_at = (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat()
-                
-                new_credentials = {
-                    **credentials,
-                    "access_token": new_access_token,
-                    "refresh_token": new_refresh_token,
-                    "expiry_date": expires_at,
-                    "expires_in": expires_in
-                }
-                
-                await self.supabase_service.update_user_credentials(
-                    user_id=user_id,
-                    app_name=app_name,
-                    credentials=new_credentials
-                )
-                
-                logger.info(f"Successfully refreshed token for {app_name}, expires at {expires_at}")
-                
+            data = {
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+                "client_id": client_id,
+                "client_secret": client_secret
+            }
+            
+            response = await self.http_client.post(token_endpoint, data=data, timeout=self.timeout)
+            response.raise_for_status()
+            
+            token_data = orjson.loads(response.content)
+            
+            new_access_token = token_data.get("access_token")
+            new_refresh_token = token_data.get("refresh_token", refresh_token)
+            expires_in = token_data.get("expires_in", 3600)
+            
+            if not new_access_token:
                 return {
-                    "success": True,
-                    "credentials": new_credentials
+                    "success": False,
+                    "error": "Failed to obtain new access token"
                 }
-                
+            
+            expires_at_epoch = time.time() + expires_in
+            expires_at = datetime.fromtimestamp(expires_at_epoch, timezone.utc).isoformat()
+            
+            new_credentials = {
+                **credentials,
+                "access_token": new_access_token,
+                "refresh_token": new_refresh_token,
+                "expiry_date": expires_at,
+                "expires_in": expires_in
+            }
+            
+            await self.supabase_service.update_user_credentials(
+                user_id=user_id,
+                app_name=app_name,
+                credentials=new_credentials
+            )
+            normalized = NormalizedCredentials(new_access_token, expires_at_epoch, new_credentials)
+            self._credentials_cache[(user_id, app_name)] = normalized
+            
+            logger.info(f"Successfully refreshed token for {app_name}, expires at {expires_at}")
+            
+            return {
+                "success": True,
+                "credentials": new_credentials,
+                "normalized": normalized
+            }
+            
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error refreshing token: {e.response.status_code} - {e.response.text}")
             return {
@@ -433,59 +552,6 @@ class ProxyService:
                 "error": f"Token refresh error: {str(e)}"
             }
     
-    def _extract_access_token(self, credentials: Dict[str, Any]) -> Optional[str]:
-        if "access_token" in credentials:
-            return credentials["access_token"]
-        
-        if "credentials" in credentials and isinstance(credentials["credentials"], dict):
-            if "access_token" in credentials["credentials"]:
-                return credentials["credentials"]["access_token"]
-        
-        if "data" in credentials and isinstance(credentials["data"], dict):
-            if "access_token" in credentials["data"]:
-                return credentials["data"]["access_token"]
-        
-        return None
-    
-    def _is_token_expired(self, credentials: Dict[str, Any]) -> bool:
-        try:
-            expires_at = None
-            
-            if "expiry_date" in credentials:
-                expires_at = credentials["expiry_date"]
-            elif "credentials" in credentials and isinstance(credentials["credentials"], dict):
-                expires_at = credentials["credentials"].get("expiry_date")
-            elif "metadata" in credentials and isinstance(credentials["metadata"], dict):
-                expires_at = credentials["metadata"].get("expiry_date")
-
-            if not expires_at:
-                logger.warning("No expiration info found in credentials, assuming token is valid")
-                return False
-            
-            if isinstance(expires_at, str):
-                expires_at_str = expires_at.replace('Z', '')
-                if '+' in expires_at_str or expires_at_str.endswith('+00:00'):
-                    expires_at_dt = datetime.fromisoformat(expires_at_str.replace('+00:00', ''))
-                else:
-                    expires_at_dt = datetime.fromisoformat(expires_at_str)
-            elif isinstance(expires_at, (int, float)):
-                expires_at_dt = datetime.utcfromtimestamp(expires_at)
-            else:
-                expires_at_dt = expires_at
-            
-            current_time = datetime.utcnow()
-            buffer_minutes = 5
-            is_expired = current_time >= (expires_at_dt - timedelta(minutes=buffer_minutes))
-            
-            if is_expired:
-                logger.info(f"Token is expired or expiring soon. Current time (UTC): {current_time}, Expires at: {expires_at_dt}")
-            
-            return is_expired
-            
-        except Exception as e:
-            logger.warning(f"Error checking token expiration: {str(e)}")
-            return True
-    
     def _normalize_app_name(self, app_name: str) -> str:
         """
         Normalize app names to match database app_type values.
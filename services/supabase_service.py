@@ -1,8 +1,9 @@
 import os
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
 from supabase import create_client, Client
-from datetime import datetime
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,13 @@ class SupabaseService:
         else:
             self.client: Client = create_client(self.url, self.key)
     
+    async def _execute(self, query):
+        """
+        Run a supabase-py query builder in a worker thread.
+        The client is synchronous, so calling execute() inline would block the event loop.
+        """
+        return await asyncio.to_thread(query.execute)
+    
     async def get_user_connected_apps(self, user_id: str) -> List[str]:
         """
         Get list of apps that user has connected
@@ -36,7 +44,7 @@ class SupabaseService:
                 return []
             
             # Query the user_connected_apps table
-            response = self.client.table("user_connected_apps").select("app_name").eq("user_id", user_id).eq("is_active", True).execute()
+            response = await self._execute(self.client.table("user_connected_apps").select("app_name").eq("user_id", user_id).eq("is_active", True))
             
             if response.data:
                 connected_apps = [row["app_name"] for row in response.data]
@@ -82,11 +90,11 @@ class SupabaseService:
                 "execution_id": execution_id,
                 "status": status,
                 "parameters": parameters or {},
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }
             
-            response = self.client.table("workflow_executions").insert(data).execute()
+            response = await self._execute(self.client.table("workflow_executions").insert(data))
             
             if response.data:
                 logger.info(f"Workflow execution saved: {execution_id}")
@@ -119,7 +127,7 @@ class SupabaseService:
                 logger.error("Supabase client not initialized")
                 return None
             
-            response = self.client.table("workflow_executions").select("*").eq("execution_id", execution_id).eq("user_id", user_id).single().execute()
+            response = await self._execute(self.client.table("workflow_executions").select("*").eq("execution_id", execution_id).eq("user_id", user_id).single())
             
             if response.data:
                 return response.data
@@ -154,13 +162,13 @@ class SupabaseService:
             
             update_data = {
                 "status": status,
-                "updated_at": datetime.utcnow().isoformat()
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }
             
             if result:
                 update_data["result"] = result
             
-            response = self.client.table("workflow_executions").update(update_data).eq("execution_id", execution_id).execute()
+            response = await self._execute(self.client.table("workflow_executions").update(update_data).eq("execution_id", execution_id))
             
             if response.data:
                 logger.info(f"Workflow status updated: {execution_id} -> {status}")
@@ -199,7 +207,7 @@ class SupabaseService:
                 return None
             
             # Check if credential already exists
-            existing = self.client.table("user_credentials").select("id").eq("user_id", user_id).eq("app_type", app_type).execute()
+            existing = await self._execute(self.client.table("user_credentials").select("id").eq("user_id", user_id).eq("app_type", app_type))
             
             data = {
                 "user_id": user_id,
@@ -208,18 +216,18 @@ class SupabaseService:
                 "credentials": credentials,  # Store encrypted in production
                 "metadata": metadata,
                 "is_active": True,
-                "updated_at": datetime.utcnow().isoformat()
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }
             
             if existing.data:
                 # Update existing credential
                 credential_id = existing.data[0]["id"]
-                response = self.client.table("user_credentials").update(data).eq("id", credential_id).execute()
+                response = await self._execute(self.client.table("user_credentials").update(data).eq("id", credential_id))
                 logger.info(f"Updated credentials for {app_name}: {credential_id}")
             else:
                 # Insert new credential
-                data["created_at"] = datetime.utcnow().isoformat()
-                response = self.client.table("user_credentials").insert(data).execute()
+                data["created_at"] = datetime.now(timezone.utc).isoformat()
+                response = await self._execute(self.client.table("user_credentials").insert(data))
                 credential_id = response.data[0]["id"] if response.data else None
                 logger.info(f"Stored new credentials for {app_name}: {credential_id}")
             
@@ -243,21 +251,21 @@ class SupabaseService:
             if not self.client:
                 return False
             
-            existing = self.client.table("user_connected_apps").select("id").eq("user_id", user_id).eq("app_type", app_type).execute()
+            existing = await self._execute(self.client.table("user_connected_apps").select("id").eq("user_id", user_id).eq("app_type", app_type))
             
             data = {
                 "user_id": user_id,
                 "app_name": app_name,
                 "app_type": app_type,
                 "is_active": True,
-                "updated_at": datetime.utcnow().isoformat()
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }
             
             if existing.data:
-                self.client.table("user_connected_apps").update(data).eq("id", existing.data[0]["id"]).execute()
+                await self._execute(self.client.table("user_connected_apps").update(data).eq("id", existing.data[0]["id"]))
             else:
-                data["created_at"] = datetime.utcnow().isoformat()
-                self.client.table("user_connected_apps").insert(data).execute()
+                data["created_at"] = datetime.now(timezone.utc).isoformat()
+                await self._execute(self.client.table("user_connected_apps").insert(data))
             
             return True
             
@@ -286,7 +294,7 @@ class SupabaseService:
                 return None
             
             # Get all active credentials for user
-            response = self.client.table("user_credentials").select("app_type, credentials, metadata").eq("user_id", user_id).eq("is_active", True).execute()
+            response = await self._execute(self.client.table("user_credentials").select("app_type, credentials, metadata").eq("user_id", user_id).eq("is_active", True))
             
             if not response.data:
                 logger.warning(f"No credentials found for user {user_id}")
@@ -327,7 +335,7 @@ class SupabaseService:
                 logger.error("Supabase client not initialized")
                 return None
             
-            logger.info(f"[DEBUG] Fetching credentials - user_id: '{user_id}', app_name: '{app_name}'")
+            logger.debug("Fetching credentials - user_id: '%s', app_name: '%s'", user_id, app_name)
             
             # Validate user_id is not empty
             if not user_id or user_id.strip() == "":
@@ -337,12 +345,9 @@ class SupabaseService:
             # Normalize app_name to app_type (lowercase)
             app_type = app_name.lower()
             
-            logger.info(f"[DEBUG] Querying Supabase with user_id='{user_id}', app_type='{app_type}'")
+            logger.debug("Querying Supabase with user_id='%s', app_type='%s'", user_id, app_type)
             
-            response = self.client.table("user_credentials").select("credentials, metadata").eq("user_id", user_id).eq("app_type", app_type).eq("is_active", True).single().execute()
-            
-            logger.info(f"[DEBUG] Supabase response status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}")
-            logger.info(f"[DEBUG] Supabase response data: {response.data}")
+            response = await self._execute(self.client.table("user_credentials").select("credentials, metadata").eq("user_id", user_id).eq("app_type", app_type).eq("is_active", True).single())
             
             if response.data and response.data.get("credentials"):
                 logger.info(f"Retrieved credentials for {app_name} for user {user_id}")
@@ -356,6 +361,54 @@ class SupabaseService:
             logger.exception(e)  # Add full exception traceback
             return None
     
+    async def get_user_apps_credentials(
+        self,
+        user_id: str,
+        app_names: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get user's credentials for several apps in a single query
+        
+        Args:
+            user_id: User's unique identifier
+            app_names: Names of apps (e.g., ["gmail", "slack"])
+            
+        Returns:
+            Dictionary mapping each requested app name to its credentials.
+            Apps without active credentials are omitted.
+        """
+        try:
+            if not self.client:
+                logger.error("Supabase client not initialized")
+                return {}
+            
+            if not user_id or not app_names:
+                return {}
+            
+            # Normalize app_name to app_type (lowercase), same as get_user_app_credentials
+            app_types = {app_name: app_name.lower() for app_name in app_names}
+            
+            response = await self._execute(self.client.table("user_credentials").select("app_type, credentials").eq("user_id", user_id).in_("app_type", list(set(app_types.values()))).eq("is_active", True))
+            
+            credentials_by_type = {
+                row["app_type"]: row["credentials"]
+                for row in response.data or []
+                if row.get("credentials")
+            }
+            
+            found = {
+                app_name: credentials_by_type[app_type]
+                for app_name, app_type in app_types.items()
+                if app_type in credentials_by_type
+            }
+            
+            logger.info(f"Retrieved credentials for {len(found)}/{len(app_types)} apps for user {user_id}")
+            return found
+            
+        except Exception as e:
+            logger.error(f"Error fetching app credentials: {str(e)}")
+            return {}
+    
     async def get_workflow_webhook_url(
         self,
         workflow_id: str
@@ -374,7 +427,7 @@ class SupabaseService:
                 logger.error("Supabase client not initialized")
                 return None
             
-            response = self.client.table("workflow_templates").select("webhook_url").eq("id", workflow_id).eq("is_active", True).single().execute()
+            response = await self._execute(self.client.table("workflow_templates").select("webhook_url").eq("id", workflow_id).eq("is_active", True).single())
             
             if response.data and response.data.get("webhook_url"):
                 webhook_url = response.data["webhook_url"]
@@ -414,10 +467,10 @@ class SupabaseService:
             
             update_data = {
                 "credentials": credentials,
-                "updated_at": datetime.utcnow().isoformat()
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }
             
-            response = self.client.table("user_credentials").update(update_data).eq("user_id", user_id).eq("app_type", app_type).execute()
+            response = await self._execute(self.client.table("user_credentials").update(update_data).eq("user_id", user_id).eq("app_type", app_type))
             
             if response.data:
                 logger.info(f"Updated credentials for {app_name} for user {user_id}")
@@ -442,7 +495,7 @@ class SupabaseService:
                 logger.error("Supabase client not initialized")
                 return []
             
-            response = self.client.table("workflow_templates").select("id, name, description, required_apps, category").eq("is_active", True).execute()
+            response = await self._execute(self.client.table("workflow_templates").select("id, name, description, required_apps, category").eq("is_active", True))
             
             if response.data:
                 logger.info(f"Retrieved {len(response.data)} workflow templates")
@@ -478,14 +531,14 @@ class SupabaseService:
             logger.info(f"Fetching workflow {workflow_id} for user {user_id}")
             
             # Try to fetch from workflow_templates first (for predefined workflows)
-            response = self.client.table("workflow_templates").select("*").eq("id", workflow_id).eq("is_active", True).single().execute()
+            response = await self._execute(self.client.table("workflow_templates").select("*").eq("id", workflow_id).eq("is_active", True).single())
             
             if response.data:
                 logger.info(f"Found workflow template: {workflow_id}")
                 return response.data
             
             # If not found in templates, try user-specific workflows
-            response = self.client.table("user_workflows").select("*").eq("id", workflow_id).eq("user_id", user_id).eq("is_active", True).single().execute()
+            response = await self._execute(self.client.table("user_workflows").select("*").eq("id", workflow_id).eq("user_id", user_id).eq("is_active", True).single())
             
             if response.data:
                 logger.info(f"Found user workflow: {workflow_id}")
@@ -541,20 +594,20 @@ class SupabaseService:
                 "category": category or "custom",
                 "webhook_url": webhook_url,
                 "is_active": True,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }
             
             # Check if workflow already exists
-            existing = self.client.table("user_workflows").select("id").eq("id", workflow_id).eq("user_id", user_id).execute()
+            existing = await self._execute(self.client.table("user_workflows").select("id").eq("id", workflow_id).eq("user_id", user_id))
             
             if existing.data:
                 # Update existing workflow
-                response = self.client.table("user_workflows").update(data).eq("id", workflow_id).eq("user_id", user_id).execute()
+                response = await self._execute(self.client.table("user_workflows").update(data).eq("id", workflow_id).eq("user_id", user_id))
                 logger.info(f"Updated user workflow: {workflow_id}")
             else:
                 # Insert new workflow
-                response = self.client.table("user_workflows").insert(data).execute()
+                response = await self._execute(self.client.table("user_workflows").insert(data))
                 logger.info(f"Saved new user workflow: {workflow_id}")
             
             return bool(response.data)
@@ -563,64 +616,3 @@ class SupabaseService:
             logger.error(f"Error saving user workflow: {str(e)}")
             logger.exception(e)
             return False
-
-
-    async def store_user_credentials(
-        self,
-        user_id: str,
-        app_name: str,
-        app_type: str,
-        credentials: Dict[str, Any],
-        metadata: Dict[str, Any]
-    ) -> Optional[str]:
-        """
-        Store user's OAuth credentials for an app
-        
-        Args:
-            user_id: User's unique identifier
-            app_name: Name of the app (e.g., "Gmail")
-            app_type: Type of the app (e.g., "gmail")
-            credentials: OAuth credentials (access_token, refresh_token, etc.)
-            metadata: Additional metadata (email, scopes, etc.)
-            
-        Returns:
-            Credential ID if successful, None otherwise
-        """
-        try:
-            if not self.client:
-                logger.error("Supabase client not initialized")
-                return None
-            
-            # Check if credential already exists
-            existing = self.client.table("user_credentials").select("id").eq("user_id", user_id).eq("app_type", app_type).execute()
-            
-            data = {
-                "user_id": user_id,
-                "app_name": app_name,
-                "app_type": app_type,
-                "credentials": credentials,  # Store encrypted in production
-                "metadata": metadata,
-                "is_active": True,
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            
-            if existing.data:
-                # Update existing credential
-                credential_id = existing.data[0]["id"]
-                response = self.client.table("user_credentials").update(data).eq("id", credential_id).execute()
-                logger.info(f"Updated credentials for {app_name}: {credential_id}")
-            else:
-                # Insert new credential
-                data["created_at"] = datetime.utcnow().isoformat()
-                response = self.client.table("user_credentials").insert(data).execute()
-                credential_id = response.data[0]["id"] if response.data else None
-                logger.info(f"Stored new credentials for {app_name}: {credential_id}")
-            
-            # Also update user_connected_apps table for quick lookup
-            await self._update_connected_apps(user_id, app_name, app_type)
-            
-            return credential_id
-            
-        except Exception as e:
-            logger.error(f"Error storing user credentials: {str(e)}")
-            return None
\ No newline at end of file